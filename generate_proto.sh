@@ -2,3 +2,5 @@
 SRC_DIR="./src/tg_sender"
 DST_DIR=$SRC_DIR
 poetry run protoc -I=$SRC_DIR --python_betterproto_out=$DST_DIR $SRC_DIR/tg_sender.proto
+# google.protobuf (upb) classes for task_stream and ShardedSender.submit_bytes
+poetry run protoc -I=$SRC_DIR --python_out=$DST_DIR $SRC_DIR/tg_sender.proto
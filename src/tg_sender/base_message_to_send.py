@@ -1,12 +1,38 @@
+import collections
 import betterproto
 
 from logger import logging
 
 from tg_sender import tg_sender_api
 
+# how many finished tasks are kept for inspection
+DONE_HISTORY = 1000
+
+def DescribeTask(task: tg_sender_api.Task) -> str:
+    """str(task) with file contents replaced by their sizes, for logs and on_error."""
+    task_name, payload = betterproto.which_one_of(task, "task")
+    payloads = [payload]
+    if task_name == "broadcast":
+        payloads.append(betterproto.which_one_of(task.broadcast, "payload")[1])
+    swapped = [(payload, payload.data) for payload in payloads if getattr(payload, "data", None)]
+    try:
+        for payload, data in swapped:
+            payload.data = [f"<{len(item)} bytes>".encode() for item in data] if isinstance(data, list) \
+                else f"<{len(data)} bytes>".encode()
+        return str(task)
+    finally:
+        for payload, data in swapped:
+            payload.data = data
+
 class BaseMessageList:
     def __init__(self):
-        self.tasks: list[tg_sender_api.Task] = []
+        # channel -> FIFO of tasks waiting for a bot
+        self.pending: dict[str, collections.deque[tg_sender_api.Task]] = {}
+        self.pending_count = 0
+        # id(task) -> task, sent to telegram and waiting for the result
+        self.in_flight: dict[int, tg_sender_api.Task] = {}
+        self.done: collections.deque[tg_sender_api.Task] = collections.deque(maxlen = DONE_HISTORY)
+        self.done_count = 0
     
     def AddTasks(self, tasks: list[tg_sender_api.Task]):
         for task in tasks:
@@ -14,48 +40,124 @@ class BaseMessageList:
 
     def AddTask(self, task: tg_sender_api.Task):
         self.ValidateTask(task)
-        self.tasks.append(task)
+        if betterproto.which_one_of(task, "task")[0] == "broadcast":
+            raise ValueError("broadcast has to be expanded, see MessagesProducer.ExpandBroadcast")
+        self.Enqueue(task)
+
+    def Enqueue(self, task: tg_sender_api.Task, front = False):
+        """Adds an already validated task, front = True keeps a retried task ahead of its channel."""
+        queue = self.pending.get(task.channel)
+        if queue is None:
+            queue = self.pending[task.channel] = collections.deque()
+        if front:
+            queue.appendleft(task)
+        else:
+            queue.append(task)
+        self.pending_count += 1
+
+    def Start(self, task: tg_sender_api.Task):
+        """pending -> in flight, O(1) for the head of a channel."""
+        queue = self.pending[task.channel]
+        if queue[0] is task:
+            queue.popleft()
+        else:
+            # deque.remove() compares messages by value, identical tasks are legit
+            del queue[next(i for i, queued in enumerate(queue) if queued is task)]
+        if not queue:
+            del self.pending[task.channel]
+        self.pending_count -= 1
+        self.in_flight[id(task)] = task
+
+    def Finish(self, task: tg_sender_api.Task):
+        """in flight -> done, or back to the head of pending if it was not sent."""
+        del self.in_flight[id(task)]
+        if task.details.sent:
+            self.done.append(task)
+            self.done_count += 1
+        else:
+            self.Enqueue(task, front = True)
+
+    def IterPending(self):
+        """Yields (channel, tasks) for channels with pending tasks, safe to Start() while iterating."""
+        for channel, queue in list(self.pending.items()):
+            yield channel, queue
+
+    def __len__(self):
+        return self.pending_count + len(self.in_flight)
         
-    def ValidateTask(self, task: tg_sender_api.Task):
-        logging.info("task: %s", task)
+    @staticmethod
+    def ValidateTask(task: tg_sender_api.Task):
+        logging.info("task: %s", DescribeTask(task))
+        task_name = betterproto.which_one_of(task, "task")[0]
+        if task_name == "broadcast":
+            if not task.broadcast.channels:
+                raise ValueError("no channels to broadcast")
+            if any(channel is None or channel == "" for channel in task.broadcast.channels):
+                raise ValueError("channel is not set")
+            payload_name, payload = betterproto.which_one_of(task.broadcast, "payload")
+            if payload_name == "":
+                raise ValueError("no broadcast payload")
+            BaseMessageList.ValidatePayload(payload_name, payload)
+            return
         if task.channel is None or task.channel == "":
             raise ValueError("channel is not set")
-        task_name = betterproto.which_one_of(task, "task")[0]
+        BaseMessageList.ValidatePayload(task_name, getattr(task, task_name) if task_name else None)
+
+    @staticmethod
+    def ValidatePayload(task_name: str, payload):
         if task_name == "send_text":
-            if task.send_text.text is None or task.send_text.text == "":
+            if payload.text is None or payload.text == "":
                 raise ValueError("no text")
         elif task_name == "send_photo":
-            if task.send_photo.path is None or task.send_photo.path == "":
+            if (payload.path is None or payload.path == "") and not payload.data:
                 raise ValueError("no photo path")
         elif task_name == "send_photos":
-            if task.send_photos.paths is None or len(task.send_photos.paths) == 0:
-                raise ValueError("no photos paths")        
+            if (payload.paths is None or len(payload.paths) == 0) and not payload.data:
+                raise ValueError("no photos paths")
         elif task_name == "send_file":
-            if task.send_file.path is None or task.send_file.path == "":
+            if (payload.path is None or payload.path == "") and not payload.data:
                 raise ValueError("no file path")
         elif task_name == "forward":
-            if task.forward.from_channel is None or task.forward.from_channel == "":
+            if payload.from_channel is None or payload.from_channel == "":
                 raise ValueError("no channel to forward")
-            if task.forward.message_id is None or task.forward.message_id == 0:
+            if payload.message_id is None or payload.message_id == 0:
                 raise ValueError("no message id to forward")
+        elif task_name == "copy":
+            if payload.from_channel is None or payload.from_channel == "":
+                raise ValueError("no channel to copy from")
+            if payload.message_id is None or payload.message_id == 0:
+                raise ValueError("no message id to copy")
         elif task_name == "pin":
-            if task.pin.message_id is None or task.pin.message_id == 0:
+            if payload.message_id is None or payload.message_id == 0:
                 raise ValueError("no message id to pin")
         elif task_name == "unpin":
-            if task.unpin.message_id is None or task.unpin.message_id == 0:
+            if payload.message_id is None or payload.message_id == 0:
                 raise ValueError("no message id to unpin")
         elif task_name == "delete":
-            if task.delete.message_id is None or task.delete.message_id == 0:
+            if payload.message_id is None or payload.message_id == 0:
                 raise ValueError("no message id to delete")
         elif task_name == "send_markup":
-            if not task.send_markup.buttons:
+            if not payload.buttons:
                 raise ValueError("no buttons")
         else:
             raise ValueError("unknown task: {}".format(task_name if task_name != "" else "empty"))
 
     def Get(self):
-        self.tasks = [ m for m in self.tasks if not m.details.sent ]
-        return [ m for m in self.tasks if not m.details.in_process ]
+        """Polling API: the producer only flips task.details flags, so sync the collections with them first."""
+        for task in list(self.in_flight.values()):
+            if not task.details.in_process:
+                self.Finish(task)
+        tasks = []
+        for channel, queue in self.IterPending():
+            for task in list(queue):
+                if task.details.sent:
+                    self.Start(task)
+                    self.Finish(task)
+                elif task.details.in_process:
+                    self.Start(task)
+                else:
+                    tasks.append(task)
+        return tasks
 
 
 
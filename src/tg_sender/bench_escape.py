@@ -0,0 +1,79 @@
+# Benchmark: bot.EscapeIfMarkdown against the previous SplitLinks + chained str.replace implementation.
+# Run with: python -m tg_sender.bench_escape
+import random
+import re
+import time
+
+from tg_sender import bot
+from tg_sender import utils
+
+MESSAGES = 2000
+MESSAGE_SIZE = 4096
+
+
+def LegacySplitLinks(text):
+    text_list = []
+    while (result := re.search(r"\[[^\]]+\]\([^\)]+\)", text)) is not None:
+        pos_from, void = result.span()
+        text_list.append(text[:pos_from])
+        text_list.append("[")
+        text = text[pos_from + 1:]
+        result = re.search(r"\]\([^\)]+\)", text)
+        pos_from, pos_to = result.span()
+        text_list.append(text[:pos_from])
+        text_list.append(result[0])
+        text = text[pos_to:]
+    text_list.append(text)
+    return text_list
+
+
+def LegacyEscapeIfMarkdown(text, parse_mode: str):
+    if text is None or text == "":
+        return text
+    if parse_mode is None or "markdown" not in parse_mode.lower():
+        return text
+    text_list = LegacySplitLinks(text)
+    for i in range(len(text_list)):
+        if i % 2 == 0:
+            text_list[i] = text_list[i].replace('.', '\\.').replace('!', '\\!').replace(',', '\\,').replace('(', '\\(') \
+                .replace(')', '\\)').replace('<', '\\<').replace('>', '\\>').replace('-', '\\-').replace('=', '\\=') \
+                .replace('[', '\\[').replace(']', '\\]').replace('|', '\\|').replace('+', '\\+').replace('#', '\\#') \
+                .replace('{', '\\{').replace('}', '\\}')
+    return "".join(text_list)
+
+
+def MakeMessage(rng):
+    words = ["price", "BTC-USD", "+3.5%", "(24h)", "volume", "#alerts", "a|b", "x=y", "{json}", "<tag>", "done!", "1,000.5"]
+    parts = []
+    size = 0
+    while size < MESSAGE_SIZE:
+        if rng.random() < 0.15:
+            part = utils.create_link(f"https://example.com/{rng.randrange(10**6)}?a=b-c", rng.choice(words))
+        else:
+            part = rng.choice(words)
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)[:MESSAGE_SIZE]
+
+
+def Measure(escape, messages):
+    started = time.perf_counter()
+    result = [escape(message, "MarkdownV2") for message in messages]
+    return time.perf_counter() - started, result
+
+
+def main():
+    rng = random.Random(1)
+    messages = [MakeMessage(rng) for _ in range(MESSAGES)]
+    legacy_time, legacy_result = Measure(LegacyEscapeIfMarkdown, messages)
+    new_time, new_result = Measure(bot.EscapeIfMarkdown, messages)
+    assert legacy_result == new_result, "output differs from the legacy escaper"
+
+    links = sum(message.count("](") for message in messages) / len(messages)
+    print(f"{MESSAGES} messages of {MESSAGE_SIZE} chars, {links:.0f} links per message")
+    print(f"split + replace: {legacy_time:.3f}s ({MESSAGES / legacy_time:,.0f} msg/s)")
+    print(f"single pass:     {new_time:.3f}s ({MESSAGES / new_time:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
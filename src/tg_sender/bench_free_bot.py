@@ -0,0 +1,52 @@
+# Microbenchmark: indexed Bots.GetFreeBot against the old linear scan over every ChannelDelay.
+# Run with: python -m tg_sender.bench_free_bot
+import random
+import time
+
+from tg_sender import bots
+from tg_sender import channel_delay
+
+BOTS_COUNT = 40
+CHANNELS_COUNT = 200
+LOOKUPS = 200_000
+
+
+class LinearScan:
+    """The previous GetFreeBot implementation, kept here as a baseline."""
+    def __init__(self, count):
+        self.delays = [channel_delay.ChannelDelay() for _ in range(count)]
+
+    def GetFreeBot(self, channel):
+        for i, delay in enumerate(self.delays):
+            if delay.IsChannelReady(channel):
+                return i, delay
+        return None, None
+
+
+def Measure(get_free_bot, channels):
+    started = time.perf_counter()
+    found = 0
+    for channel in channels:
+        free_bot, delay = get_free_bot(channel)
+        if free_bot is not None:
+            delay.UpdateChannelReady(channel, 60)
+            found += 1
+    return time.perf_counter() - started, found
+
+
+def main():
+    random.seed(1)
+    channels = [f"@channel_{random.randrange(CHANNELS_COUNT)}" for _ in range(LOOKUPS)]
+    tokens = [f"{100000 + i}:BENCH" for i in range(BOTS_COUNT)]
+
+    scan_time, scan_found = Measure(LinearScan(BOTS_COUNT).GetFreeBot, channels)
+    index_time, index_found = Measure(bots.Bots(tokens, rate = 1e9, burst = 1e9).GetFreeBot, channels)
+    assert scan_found == index_found
+
+    print(f"{LOOKUPS} lookups, {BOTS_COUNT} bots, {CHANNELS_COUNT} channels, {scan_found} dispatched")
+    print(f"linear scan: {scan_time:.3f}s ({LOOKUPS / scan_time:,.0f} lookups/s)")
+    print(f"heap index:  {index_time:.3f}s ({LOOKUPS / index_time:,.0f} lookups/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Benchmark: reading a length-delimited task stream with the betterproto and protobuf (upb) decoders.
+# Run with: python -m tg_sender.bench_task_stream [tasks]
+import os
+import sys
+import tempfile
+import time
+
+from google.protobuf.internal import api_implementation
+
+from tg_sender import task_stream
+from tg_sender import tg_sender_pb2
+
+TASKS_COUNT = 1_000_000
+CHANNELS_COUNT = 1000
+
+
+def MakeTask(i):
+    task = tg_sender_pb2.Task(channel = f"@channel_{i % CHANNELS_COUNT}")
+    task.options.parse_mode = "MarkdownV2"
+    if i % 3 == 0:
+        task.send_photo.caption = f"photo {i}"
+        task.send_photo.path = f"/data/photos/{i}.jpg"
+    else:
+        task.send_text.text = f"message number {i} " * 8
+    return task.SerializeToString()
+
+
+def WriteFile(path, count):
+    with open(path, "wb") as f:
+        batch = []
+        for i in range(count):
+            batch.append(task_stream.EncodeFrame(MakeTask(i)))
+            if len(batch) == 10_000:
+                f.write(b"".join(batch))
+                batch.clear()
+        f.write(b"".join(batch))
+
+
+def Measure(name, path, count, fn):
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        read = fn(f)
+    elapsed = time.perf_counter() - started
+    assert read == count
+    print(f"{name:<22} {elapsed:7.2f}s ({count / elapsed:,.0f} tasks/s)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else TASKS_COUNT
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "tasks.bin")
+        WriteFile(path, count)
+        print(f"{count} tasks, {os.path.getsize(path) / 2**20:.1f} MiB, protobuf implementation: {api_implementation.Type()}")
+
+        Measure("frames only", path, count, lambda f: sum(1 for _ in task_stream.ReadFrames(f)))
+        for decoder in task_stream.DECODERS:
+            Measure(f"{decoder} decode", path, count, lambda f: sum(1 for _ in task_stream.ReadTasks(f, decoder)))
+        # what ShardedSender.submit_bytes needs: the channel of every task
+        Measure("protobuf channel only", path, count,
+                lambda f: len([task.channel for task in task_stream.ReadTasks(f, task_stream.DECODER_PROTOBUF)]))
+
+
+if __name__ == "__main__":
+    main()
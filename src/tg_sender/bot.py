@@ -1,35 +1,46 @@
 import aiogram
+from aiogram import exceptions
 from aiogram import types
 from aiogram.utils.media_group import MediaGroupBuilder
-from aiogram.types.input_file import FSInputFile
+from aiogram.types.input_file import FSInputFile, BufferedInputFile
+from aiogram.client.session.aiohttp import AiohttpSession
 import re
 import os
+import contextlib
+import asyncio
 
 from dataclasses import dataclass
 
 from logger import logging
 from tg_sender import base_message_data
+from tg_sender import rate_limiter
+from tg_sender import file_id_cache
+from tg_sender import file_io as file_io_module
+
+LINK_REGEX = re.compile(r"\[([^\]]+)\](\([^\)]+\))")
+# can not be a part of a message, joins the pieces to escape them with one call chain
+SEPARATOR = "\x00"
 
 def SplitLinks(text):
+    """[text, "[", caption, "](link)", text, ...], even items are not part of link markup."""
     text_list = []
-    while (result := re.search(r"\[[^\]]+\]\([^\)]+\)", text)) is not None:
-        pos_from, void = result.span()
-        # Uncouple text until the [
-        text_list.append(text[:pos_from])
-        # Uncouple the [ itself
+    pos = 0
+    for result in LINK_REGEX.finditer(text):
+        text_list.append(text[pos:result.start()])
         text_list.append("[")
-        text = text[pos_from + 1:]
-        # Find where the link caption ends
-        result = re.search(r"\]\([^\)]+\)", text)
-        pos_from, pos_to = result.span()
-        # Uncouple the link caption
-        text_list.append(text[:pos_from])
-        # Uncouple the remainder: ](link)
-        text_list.append(result[0])
-        text = text[pos_to:]
-    text_list.append(text)
+        text_list.append(result[1])
+        text_list.append("]" + result[2])
+        pos = result.end()
+    text_list.append(text[pos:])
     return text_list
 
+# str.replace chain beats str.translate and re.sub on CPython, it just has to run once per text
+def _EscapeText(text):
+    return text.replace('.', '\\.').replace('!', '\\!').replace(',', '\\,').replace('(', '\\(') \
+        .replace(')', '\\)').replace('<', '\\<').replace('>', '\\>').replace('-', '\\-').replace('=', '\\=') \
+        .replace('[', '\\[').replace(']', '\\]').replace('|', '\\|').replace('+', '\\+').replace('#', '\\#') \
+        .replace('{', '\\{').replace('}', '\\}')
+
 # Escapes everything that is NOT markdown
 def EscapeIfMarkdown(text, parse_mode: str):
     if text is None or text == "":
@@ -37,22 +48,40 @@ def EscapeIfMarkdown(text, parse_mode: str):
     if parse_mode is None or "markdown" not in parse_mode.lower():
         return text
     text_list = SplitLinks(text)
-    for i in range(len(text_list)):
-        if i % 2 == 0:
-            text_list[i] = text_list[i].replace('.', '\\.').replace('!', '\\!').replace(',', '\\,').replace('(', '\\(') \
-                .replace(')', '\\)').replace('<', '\\<').replace('>', '\\>').replace('-', '\\-').replace('=', '\\=') \
-                .replace('[', '\\[').replace(']', '\\]').replace('|', '\\|').replace('+', '\\+').replace('#', '\\#') \
-                .replace('{', '\\{').replace('}', '\\}')
+    if len(text_list) == 1:
+        return _EscapeText(text)
+    to_escape = text_list[0::2]
+    if SEPARATOR in text:
+        escaped = [_EscapeText(piece) for piece in to_escape]
+    else:
+        escaped = _EscapeText(SEPARATOR.join(to_escape)).split(SEPARATOR)
+    text_list[0::2] = escaped
     return "".join(text_list)
 
 # Escapes markdown symbols, opposite to upper function
 def EscapeMarkdown(text):
     return str(text).replace('\\', '\\\\').replace('_', '\\_').replace('~', '\\~').replace('*', '\\*').replace('`', '\\`')
 
+def DescribeFile(path: str | bytes) -> str:
+    return f"<{len(path)} bytes>" if isinstance(path, bytes) else path
+
 class SenderBot:
-    def __init__(self, token):
+    def __init__(self, token, token_bucket: rate_limiter.TokenBucket = None,
+                 file_ids: file_id_cache.FileIdCache = None, render_cache = None, session: AiohttpSession = None,
+                 file_io: file_io_module.FileIO = None, image_preprocessor = None):
         self.token = token
-        self.bot = aiogram.Bot(token=token)
+        # session may be shared with other bots, its owner closes it
+        self.bot = aiogram.Bot(token=token, session=session)
+        # global per-token limit, per-channel limits live in ChannelDelay
+        self.rate_limiter = token_bucket if token_bucket is not None else rate_limiter.TokenBucket()
+        # already uploaded files are sent by file_id, None disables it
+        self.file_id_cache = file_ids
+        # render_cache.RenderCache shared by the bots, None escapes every time
+        self.render_cache = render_cache
+        # existence checks and reads of media files, off the event loop
+        self.file_io = file_io if file_io is not None else file_io_module.FileIO()
+        # image_preprocessor.ImagePreprocessor for photos, None sends them as they are
+        self.image_preprocessor = image_preprocessor
         # Обфусцированный токен для логов
         self.obfuscated_token = self._obfuscate_token()
 
@@ -69,8 +98,91 @@ class SenderBot:
             return f"{prefix}"
         return "*****"
 
+    def _Render(self, bmd: base_message_data.BaseMessageData):
+        return self._RenderText(bmd.text, bmd.parse_mode)
+
+    def _RenderText(self, text: str, parse_mode: str):
+        if self.render_cache is None:
+            return EscapeIfMarkdown(text, parse_mode)
+        return self.render_cache.Render(text, parse_mode)
+
+    async def _MakeInputFile(self, source, stat, filename: str = None, preprocess: bool = False):
+        """source is a path or the contents of the file, small files are read in the file_io pool.
+
+        With preprocess photos go through image_preprocessor first.
+        """
+        if preprocess and self.image_preprocessor is not None:
+            data = source if isinstance(source, bytes) else await self.file_io.Read(source)
+            return BufferedInputFile(await self.image_preprocessor.Process(data), filename or "file")
+        if isinstance(source, bytes):
+            return BufferedInputFile(source, filename or "file")
+        if self.file_io.ShouldPrefetch(stat):
+            return BufferedInputFile(await self.file_io.Read(source), filename or os.path.basename(source))
+        return FSInputFile(source, filename)
+
+    def _GetKey(self, source, stat, preprocess: bool = False):
+        """Key of the original file; a preprocessed upload is a different file for every preprocessor setting."""
+        if isinstance(source, bytes):
+            key = file_id_cache.FileIdCache.GetContentKey(self.obfuscated_token, source)
+        else:
+            key = file_id_cache.FileIdCache.GetKeyFromStat(self.obfuscated_token, source, stat)
+        if preprocess and self.image_preprocessor is not None:
+            key += ":" + self.image_preprocessor.GetSettingsKey()
+        return key
+
+    async def _GetInputFile(self, source, stat, key, filename: str = None, file_ids: file_id_cache.FileIdCache = None,
+                            preprocess: bool = False):
+        """Returns file_id if the file is cached under key, an input file otherwise."""
+        if key is not None:
+            file_id = file_ids.Get(key)
+            if file_id is not None:
+                return file_id
+        return await self._MakeInputFile(source, stat, filename, preprocess)
+
+    async def _SendFiles(self, paths: list, send, get_file_ids, filename: str = None, file_ids: file_id_cache.FileIdCache = None,
+                         preprocess: bool = False):
+        """Calls send(files) with cached file_ids where possible and remembers the new ones.
+
+        paths are file paths or file contents (bytes), `filename` is what telegram shows for contents.
+        file_ids replaces the bot's cache for this call, e.g. a cache of one broadcast.
+        With preprocess (photos) only files that are not cached yet are read and preprocessed.
+        """
+        file_ids = file_ids if file_ids is not None else self.file_id_cache
+        stats = await self.file_io.StatAll(paths)
+        if file_ids is None:
+            return await self.__SendFiles(paths, stats, [None] * len(paths), send, get_file_ids, filename, None, preprocess)
+        keys = [self._GetKey(path, stat, preprocess) for path, stat in zip(paths, stats)]
+        # the same file sent to many chats at once is uploaded by the first send, the rest wait for its file_id
+        async with contextlib.AsyncExitStack() as stack:
+            for key in sorted(set(keys)):
+                if not file_ids.Contains(key):
+                    await stack.enter_async_context(file_ids.GetUploadLock(key))
+            return await self.__SendFiles(paths, stats, keys, send, get_file_ids, filename, file_ids, preprocess)
+
+    async def __SendFiles(self, paths: list, stats: list, keys: list, send, get_file_ids, filename: str,
+                          file_ids: file_id_cache.FileIdCache, preprocess: bool):
+        files = list(await asyncio.gather(*[self._GetInputFile(path, stat, key, filename, file_ids, preprocess)
+                                            for path, stat, key in zip(paths, stats, keys)]))
+        try:
+            result = await send(files)
+        except exceptions.TelegramBadRequest as br:
+            cached = [key for file, key in zip(files, keys) if isinstance(file, str)]
+            if not cached or "file" not in str(br).lower():
+                raise br
+            # file_id expired or belongs to another bot, upload again
+            logging.error(f"Token: {self.obfuscated_token} | cached file_id rejected: {br}")
+            for key in cached:
+                file_ids.Invalidate(key)
+            files = list(await asyncio.gather(*[self._MakeInputFile(path, stat, filename, preprocess)
+                                                for path, stat in zip(paths, stats)]))
+            result = await send(files)
+        if file_ids is not None:
+            for key, file_id in zip(keys, get_file_ids(result)):
+                file_ids.Put(key, file_id)
+        return result
+
     async def SendText(self, bmd: base_message_data.BaseMessageData):
-        text_to_send = EscapeIfMarkdown(bmd.text, bmd.parse_mode)
+        text_to_send = self._Render(bmd)
         logging.info(f"Token: {self.obfuscated_token} | Sending message to {bmd.channel}, thread_id: {bmd.thread_id}\n"
                      f"Options: parse_mode: {bmd.parse_mode}, reply_to: {bmd.reply_to}\n"
                      f"Content:\n{text_to_send}")
@@ -84,7 +196,7 @@ class SenderBot:
         )
 
     async def send_markup(self, bmd: base_message_data.BaseMessageData):
-        text_to_send = EscapeIfMarkdown(bmd.text, bmd.parse_mode)
+        text_to_send = self._Render(bmd)
         logging.info(f"Token: {self.obfuscated_token} | Sending msg with markup to {bmd.channel}, thread_id: {bmd.thread_id}\n"
                      f"Options: parse_mode: {bmd.parse_mode}, reply_to: {bmd.reply_to}\n"
                      f"Content:\n{text_to_send}")
@@ -107,58 +219,71 @@ class SenderBot:
         result = await self.bot.forward_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id, message_thread_id=thread_id)
         return result
 
-    async def SendPhoto(self, bmd: base_message_data.BaseMessageData, path: str):
-        if not os.path.exists(path):
-            raise FileNotFoundError(path)
-        photo_file = FSInputFile(path)
-        text_to_send = EscapeIfMarkdown(bmd.text, bmd.parse_mode)
+    async def ForwardMany(self, chat_id: str, from_chat_id: str, message_ids: list[int], thread_id: int):
+        """Up to 100 ids in increasing order, returns MessageIds of the messages that were forwarded."""
+        logging.info(f"Token: {self.obfuscated_token} | Forwarding {len(message_ids)} messages from chat {from_chat_id} to {chat_id} in thread {thread_id}: {message_ids}")
+        return await self.bot.forward_messages(chat_id=chat_id, from_chat_id=from_chat_id, message_ids=message_ids, message_thread_id=thread_id)
+
+    async def Copy(self, chat_id: str, from_chat_id: str, message_id: int, thread_id: int, remove_caption: bool = False):
+        logging.info(f"Token: {self.obfuscated_token} | Copying message {message_id} from chat {from_chat_id} to {chat_id} in thread {thread_id}")
+        caption = "" if remove_caption else None
+        return await self.bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id, message_thread_id=thread_id, caption=caption)
+
+    async def CopyMany(self, chat_id: str, from_chat_id: str, message_ids: list[int], thread_id: int, remove_caption: bool = False):
+        """Up to 100 ids in increasing order, returns MessageIds of the messages that were copied."""
+        logging.info(f"Token: {self.obfuscated_token} | Copying {len(message_ids)} messages from chat {from_chat_id} to {chat_id} in thread {thread_id}: {message_ids}")
+        return await self.bot.copy_messages(chat_id=chat_id, from_chat_id=from_chat_id, message_ids=message_ids, message_thread_id=thread_id, remove_caption=remove_caption)
+
+    async def SendPhoto(self, bmd: base_message_data.BaseMessageData, path: str | bytes, file_ids: file_id_cache.FileIdCache = None):
+        text_to_send = self._Render(bmd)
         logging.info(f"Token: {self.obfuscated_token} | Sending photo to {bmd.channel}\n"
                      f"Options: parse_mode: {bmd.parse_mode}, reply_to: {bmd.reply_to}\n"
                      f"Content:\n{text_to_send}")
-        return await self.bot.send_photo(
+        return await self._SendFiles([path], lambda files: self.bot.send_photo(
             bmd.channel,
             message_thread_id=bmd.thread_id,
-            photo=photo_file,
+            photo=files[0],
             caption=text_to_send,
             parse_mode=bmd.parse_mode,
             reply_to_message_id=bmd.reply_to
-        )
+        ), lambda message: [message.photo[-1].file_id], file_ids = file_ids, preprocess = True)
 
-    async def SendMultipleImages(self, bmd: base_message_data.BaseMessageData, paths: list[str]):
-        for path in paths:
-            if not os.path.exists(path):
-                raise FileNotFoundError(path)
-        text_to_send = EscapeIfMarkdown(bmd.text, bmd.parse_mode)
+    async def SendMultipleImages(self, bmd: base_message_data.BaseMessageData, paths: list[str | bytes], captions: list[str] = None,
+                                 file_ids: file_id_cache.FileIdCache = None):
+        """bmd.text is the caption of the first photo, or captions[i] is the caption of the i-th one."""
+        if captions is None:
+            captions = [bmd.text]
+        texts_to_send = [self._RenderText(caption, bmd.parse_mode) for caption in captions]
         logging.info(f"Token: {self.obfuscated_token} | Sending photos to {bmd.channel}\n"
-                     f"Paths: {paths}\n"
+                     f"Paths: {[DescribeFile(path) for path in paths]}\n"
                      f"Options: parse_mode: {bmd.parse_mode}, reply_to: {bmd.reply_to}\n"
-                     f"Content: {text_to_send}")
-        
-        media = MediaGroupBuilder()
-
-        for i, path in enumerate(paths):
-            if i == 0:
-                media.add(type="photo", media=FSInputFile(path), caption=text_to_send, parse_mode=bmd.parse_mode)
-            else:
-                media.add(type="photo", media=FSInputFile(path))
-        return await self.bot.send_media_group(chat_id=bmd.channel, message_thread_id=bmd.thread_id, media=media.build(), reply_to_message_id=bmd.reply_to)
-
-    async def SendFile(self, bmd: base_message_data.BaseMessageData, path: str):
-        if not os.path.exists(path):
-            raise FileNotFoundError(path)
-        text_to_send = EscapeIfMarkdown(bmd.text, bmd.parse_mode)
+                     f"Content: {texts_to_send}")
+
+        def send(files):
+            media = MediaGroupBuilder()
+            for i, file in enumerate(files):
+                if i < len(texts_to_send) and texts_to_send[i]:
+                    media.add(type="photo", media=file, caption=texts_to_send[i], parse_mode=bmd.parse_mode)
+                else:
+                    media.add(type="photo", media=file)
+            return self.bot.send_media_group(chat_id=bmd.channel, message_thread_id=bmd.thread_id, media=media.build(), reply_to_message_id=bmd.reply_to)
+        return await self._SendFiles(paths, send, lambda messages: [message.photo[-1].file_id for message in messages],
+                                     file_ids = file_ids, preprocess = True)
+
+    async def SendFile(self, bmd: base_message_data.BaseMessageData, path: str | bytes, filename: str = None,
+                       file_ids: file_id_cache.FileIdCache = None):
+        text_to_send = self._Render(bmd)
         logging.info(f"Token: {self.obfuscated_token} | Sending file to {bmd.channel}\n"
                      f"Options: parse_mode: {bmd.parse_mode}, reply_to: {bmd.reply_to}\n"
                      f"Content:\n{text_to_send}")
-        document = FSInputFile(path)
-        return await self.bot.send_document(
+        return await self._SendFiles([path], lambda files: self.bot.send_document(
             bmd.channel,
             message_thread_id=bmd.thread_id,
-            document=document,
+            document=files[0],
             caption=text_to_send,
             parse_mode=bmd.parse_mode,
             reply_to_message_id=bmd.reply_to,
-        )
+        ), lambda message: [message.document.file_id], filename, file_ids)
 
     async def Pin(self, chat_id: str, message_id, disable_notification: bool):
         logging.info(f"Token: {self.obfuscated_token} | Pinning message {message_id} in chat {chat_id} without notification: {disable_notification}")
@@ -171,3 +296,8 @@ class SenderBot:
     async def Delete(self, chat_id: str, message_id):
         logging.info(f"Token: {self.obfuscated_token} | Deleting message {message_id} in chat {chat_id}")
         return await self.bot.delete_message(chat_id, message_id)
+
+    async def DeleteMany(self, chat_id: str, message_ids: list[int]):
+        """Up to 100 messages of one chat, the ones that can't be found are skipped by telegram."""
+        logging.info(f"Token: {self.obfuscated_token} | Deleting {len(message_ids)} messages in chat {chat_id}: {message_ids}")
+        return await self.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
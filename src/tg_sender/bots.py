@@ -1,29 +1,183 @@
+import asyncio
+import heapq
+import time
+from threading import Lock
+
 from tg_sender import channel_delay
 from tg_sender import bot
+from tg_sender import rate_limiter
+from tg_sender import rate_policy
+from tg_sender import file_id_cache
+from tg_sender import render_cache as render_cache_module
+from tg_sender import http_session
+from tg_sender import file_io as file_io_module
+from tg_sender import image_preprocessor as image_preprocessor_module
+from tg_sender import rate_backend as rate_backend_module
+from aiogram.client.session.aiohttp import AiohttpSession
+
+NEVER = float("-inf")
 
 
 class Bots:
-    def __init__(self, bot_tokens: list[str]):
+    def __init__(self, bot_tokens: list[str], rate: float = rate_limiter.DEFAULT_RATE, burst: float = rate_limiter.DEFAULT_BURST,
+                 policies: dict[rate_policy.ChatType, rate_policy.RatePolicy] = None,
+                 file_ids: file_id_cache.FileIdCache = None, render_cache: render_cache_module.RenderCache = None,
+                 session: AiohttpSession = None, file_io: file_io_module.FileIO = None,
+                 image_preprocessor: image_preprocessor_module.ImagePreprocessor = None, rate_backend = None):
         if bot_tokens is None or len(bot_tokens) == 0 or not isinstance(bot_tokens, list):
             raise ValueError("declare bots first")
-        self.__bots: list[bot.SenderBot] = [] 
+        self.file_ids = file_ids
+        # escaped texts are shared by all bots: broadcasts and retries render the same text again
+        self.render_cache = render_cache if render_cache is not None else render_cache_module.RenderCache()
+        # one connection pool for all tokens, see http_session.CreateSession for tuning
+        self.session = session if session is not None else http_session.CreateSession()
+        # a session passed in belongs to the caller, only our own one is closed in __aexit__
+        self.owns_session = session is None
+        # one thread pool for the filesystem calls of all bots
+        self.file_io = file_io if file_io is not None else file_io_module.FileIO()
+        # optional downscale and re-encode of photos before upload
+        self.image_preprocessor = image_preprocessor
+        self.__bots: list[bot.SenderBot] = []
         for bot_token in bot_tokens:
-            self.__bots.append(bot.SenderBot(bot_token))
+            self.__bots.append(bot.SenderBot(bot_token, rate_limiter.TokenBucket(rate, burst), file_ids, self.render_cache,
+                                             self.session, self.file_io, image_preprocessor))
 
+        self.rate_policies = rate_policy.RatePolicies(policies)
+        # rate_backend.MemoryBackend/SqliteBackend shared with other senders of the same tokens, None keeps limits local
+        self.rate_backend = rate_backend
         self.__delays: list[channel_delay.ChannelDelay] = []
-        for _ in range(len(self.__bots)):
-            self.__delays.append(channel_delay.ChannelDelay())
-    
+        for i in range(len(self.__bots)):
+            self.__delays.append(channel_delay.ChannelDelay(
+                on_update = lambda channel, dt, i = i: self.__OnChannelUpdate(i, channel, dt),
+                eviction_delay = self.rate_policies.max_tolerance))
+
+        # channel -> min-heap of (ready_time, bot index), entries are invalidated lazily
+        self.__ready: dict[str, list[tuple[float, int]]] = {}
+        self.__lock = Lock()
+        self.__updates_since_sweep = 0
+
+    def __OnChannelUpdate(self, i, channel, dt):
+        with self.__lock:
+            heap = self.__ready.get(channel)
+            if heap is None:
+                heap = [(NEVER, j) for j in range(len(self.__bots)) if j != i]
+                heapq.heapify(heap)
+                self.__ready[channel] = heap
+            heapq.heappush(heap, (dt, i))
+            if len(heap) > 4 * len(self.__bots):
+                self.__Compact(channel)
+            self.__updates_since_sweep += 1
+            if self.__updates_since_sweep >= max(channel_delay.SWEEP_MIN_UPDATES, len(self.__ready)):
+                self.__Sweep()
+
+    def __Compact(self, channel):
+        heap = []
+        for i in range(len(self.__bots)):
+            dt = self.__delays[i].GetChannelReadyTime(channel)
+            heap.append((NEVER if dt is None else dt, i))
+        heapq.heapify(heap)
+        self.__ready[channel] = heap
+
+    def __Sweep(self):
+        # channels where every bot is ready again carry no information, the heap is recreated on demand
+        self.__updates_since_sweep = 0
+        for channel in list(self.__ready):
+            if all(delay.GetChannelReadyTime(channel) is None for delay in self.__delays):
+                del self.__ready[channel]
+
+    def __Top(self, heap, channel):
+        """Returns the valid (ready_time, bot index) with the earliest ready time, None if heap is empty."""
+        while heap:
+            dt, i = heap[0]
+            current = self.__delays[i].GetChannelReadyTime(channel)
+            # None means the deadline has passed and was evicted, so the entry is in the past too
+            if current is None or current == dt:
+                return dt, i
+            heapq.heappop(heap) # stale, bot was updated after this entry was pushed
+        return None
+
     def GetFreeBot(self, channel):
-        for i, channel_delay in enumerate(self.__delays):
-            if channel_delay.IsChannelReady(channel):
-                return self.__bots[i], channel_delay
+        with self.__lock:
+            heap = self.__ready.get(channel)
+            if heap is None: # nobody has posted there yet
+                for i, sender in enumerate(self.__bots):
+                    if sender.rate_limiter.IsReady():
+                        return sender, self.__delays[i]
+                return None, None
+            now = time.monotonic()
+            # bots ready for the channel but out of global budget are put aside and returned afterwards
+            skipped = []
+            try:
+                while (top := self.__Top(heap, channel)) is not None and top[0] <= now:
+                    i = top[1]
+                    if self.__bots[i].rate_limiter.IsReady():
+                        return self.__bots[i], self.__delays[i]
+                    skipped.append(heapq.heappop(heap))
+            finally:
+                for entry in skipped:
+                    heapq.heappush(heap, entry)
         return None, None
 
+    def GetSecondsUntilReady(self, channel):
+        """Time until GetFreeBot(channel) returns a bot: the earliest bot ready both for the channel and by its tokens."""
+        with self.__lock:
+            heap = self.__ready.get(channel)
+            if heap is None: # every bot is ready for the channel
+                return min(sender.rate_limiter.GetSecondsUntilReady() for sender in self.__bots)
+            now = time.monotonic()
+            best = None
+            # bots in channel order: once a bot's channel wait is no shorter than the best wait, the rest are no better
+            visited = []
+            try:
+                while (top := self.__Top(heap, channel)) is not None:
+                    channel_wait = top[0] - now
+                    if best is not None and channel_wait >= best:
+                        break
+                    seconds = max(channel_wait, self.__bots[top[1]].rate_limiter.GetSecondsUntilReady())
+                    if best is None or seconds < best:
+                        best = seconds
+                    visited.append(heapq.heappop(heap))
+            finally:
+                for entry in visited:
+                    heapq.heappush(heap, entry)
+        return max(best, 0)
+
+    async def ReserveMany(self, reservations: list[tuple]) -> list[bool]:
+        """Confirms sends taken from the local limits, (bot, channel_delay, channel, policy) each, with rate_backend.
+
+        One backend call for the batch, in a thread: a backend may wait for a lock held by another process.
+        Local limits are moved to the ready times the backend knows,
+        so a bot or channel that another process has used is not offered again too early.
+        """
+        if self.rate_backend is None or not reservations:
+            return [True] * len(reservations)
+        groups = []
+        for sender, _, channel, policy in reservations:
+            bucket = sender.rate_limiter
+            groups.append([
+                rate_backend_module.Request(f"{sender.bot.id}:{channel}", policy.interval, policy.tolerance),
+                rate_backend_module.Request(str(sender.bot.id), 1 / bucket.rate, (bucket.burst - 1) / bucket.rate),
+            ])
+        results = await asyncio.get_running_loop().run_in_executor(None, self.rate_backend.ReserveMany, groups)
+        now = time.time()
+        for (sender, delay, channel, _), (_, (channel_ready, bot_ready)) in zip(reservations, results):
+            delay.UpdateChannelReady(channel, channel_ready - now)
+            if bot_ready > now:
+                sender.rate_limiter.Hold(bot_ready - now)
+        return [allowed for allowed, _ in results]
+
+    def GetStats(self):
+        """Per-bot flood wait statistics, see TokenBucket.GetStats."""
+        return {sender.bot.id: sender.rate_limiter.GetStats() for sender in self.__bots}
+
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, *excinfo):
-        for bot in self.__bots:
-            await bot.bot.session.close()
-
+        if self.owns_session:
+            await self.session.close()
+        self.file_io.Close()
+        if self.image_preprocessor is not None:
+            self.image_preprocessor.Close()
+        if self.file_ids is not None:
+            self.file_ids.Save()
@@ -1,26 +1,71 @@
-from dataclasses import dataclass
-import datetime
+import time
 from threading import Lock
 
-@dataclass
-class ChannelInfo:
-    dt: datetime.datetime
+from tg_sender import rate_policy
+
+# expired entries are swept at most once per this many updates (or per table size, whichever is bigger)
+SWEEP_MIN_UPDATES = 1024
 
 class ChannelDelay:
-    def __init__(self):
-        self.channel_infos = {}
+    def __init__(self, on_update = None, eviction_delay = 0):
+        # channel -> monotonic time when the channel is ready again, entries in the past are evicted lazily
+        self.channel_infos: dict[str, float] = {}
+        # bursty policies still need the ready time for a while after it has passed
+        self.eviction_delay = eviction_delay
         self.lock = Lock()
+        # called as on_update(channel, ready_time) after every change, lets Bots keep its index
+        self.on_update = on_update
+        self.updates_since_sweep = 0
+
+    def __GetReadyTime(self, channel, now):
+        ready_time = self.channel_infos.get(channel)
+        if ready_time is not None and ready_time <= now:
+            if ready_time + self.eviction_delay <= now:
+                del self.channel_infos[channel]
+            return None
+        return ready_time
 
     def IsChannelReady(self, channel):
         with self.lock:
-            if channel in self.channel_infos:
-                return datetime.datetime.now() >= self.channel_infos[channel].dt
-        return True
+            return self.__GetReadyTime(channel, time.monotonic()) is None
+
+    def GetChannelReadyTime(self, channel):
+        """Monotonic time when the channel is ready, None if it is ready already."""
+        with self.lock:
+            return self.__GetReadyTime(channel, time.monotonic())
 
-    def UpdateChannelReady(self, channel, seconds = 1):
+    def GetSecondsUntilReady(self, channel):
         with self.lock:
-            dt = datetime.datetime.now() + datetime.timedelta(seconds = seconds)
-            if channel not in self.channel_infos:
-                self.channel_infos[channel] = ChannelInfo(dt = dt)
+            now = time.monotonic()
+            ready_time = self.__GetReadyTime(channel, now)
+        if ready_time is None:
+            return 0
+        return ready_time - now
+
+    def UpdateChannelReady(self, channel, seconds = None, policy: rate_policy.RatePolicy = None):
+        """Holds the channel for `seconds` if given, otherwise accounts one message sent under `policy`."""
+        with self.lock:
+            now = time.monotonic()
+            if seconds is not None:
+                ready_time = now + seconds
             else:
-                self.channel_infos[channel].dt = dt
\ No newline at end of file
+                if policy is None:
+                    policy = rate_policy.DEFAULT_POLICIES[rate_policy.ChatType.CHAT_TYPE_UNKNOWN]
+                ready_time = self.channel_infos.get(channel)
+                # theoretical arrival time of the next message, ready_time is `tolerance` before it
+                tat = now if ready_time is None else max(ready_time + policy.tolerance, now)
+                ready_time = tat + policy.interval - policy.tolerance
+            self.channel_infos[channel] = ready_time
+            self.updates_since_sweep += 1
+            if self.updates_since_sweep >= max(SWEEP_MIN_UPDATES, len(self.channel_infos)):
+                self.__Sweep(now)
+        if self.on_update is not None:
+            self.on_update(channel, ready_time)
+
+    def __Sweep(self, now):
+        self.updates_since_sweep = 0
+        self.channel_infos = {channel: ready_time for channel, ready_time in self.channel_infos.items()
+                              if ready_time + self.eviction_delay > now}
+
+    def __len__(self):
+        return len(self.channel_infos)
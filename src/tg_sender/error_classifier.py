@@ -0,0 +1,79 @@
+import random
+from dataclasses import dataclass
+
+from aiogram import exceptions
+
+from tg_sender import tg_sender_api
+
+PERMANENT = "permanent"            # give up, the same request would fail again
+RETRYABLE = "retryable"            # send the same request again after a backoff
+FIX_THEN_RETRY = "fix_then_retry"  # change the request and send it again right away
+
+def ClearReplyTo(task: tg_sender_api.Task):
+    task.options.reply_to = None
+
+def ClearParseMode(task: tg_sender_api.Task):
+    task.options.parse_mode = None
+
+def ClearThreadId(task: tg_sender_api.Task):
+    task.thread_id = None
+
+@dataclass(frozen=True)
+class ErrorRule:
+    """Errors of `error_type` with `text` in the message (any message if None) have `outcome`.
+
+    `fix` is applied to the task before a FIX_THEN_RETRY, `counts_attempt` = False
+    is for errors that are not the task's fault, like a flood wait.
+    """
+    error_type: type
+    text: str = None
+    outcome: str = PERMANENT
+    fix: object = None
+    counts_attempt: bool = True
+
+# the first matching rule wins, so subclasses and specific texts go first
+RULES = [
+    ErrorRule(FileNotFoundError),
+    ErrorRule(exceptions.TelegramRetryAfter, outcome = RETRYABLE, counts_attempt = False),
+    ErrorRule(exceptions.TelegramMigrateToChat),
+    ErrorRule(exceptions.TelegramForbiddenError),
+    ErrorRule(exceptions.TelegramUnauthorizedError),
+    ErrorRule(exceptions.TelegramEntityTooLarge),
+    ErrorRule(exceptions.TelegramBadRequest, "Replied message not found", FIX_THEN_RETRY, ClearReplyTo),
+    ErrorRule(exceptions.TelegramBadRequest, "can't parse entities", FIX_THEN_RETRY, ClearParseMode),
+    ErrorRule(exceptions.TelegramBadRequest, "message thread not found", FIX_THEN_RETRY, ClearThreadId),
+    ErrorRule(exceptions.TelegramBadRequest, "too long"),
+    ErrorRule(exceptions.TelegramBadRequest, "chat not found"),
+    ErrorRule(exceptions.TelegramBadRequest, "message to delete not found"),
+    ErrorRule(exceptions.TelegramBadRequest, "TOPIC_CLOSED"),
+    ErrorRule(exceptions.TelegramBadRequest, "message can't be deleted"),
+    ErrorRule(exceptions.TelegramBadRequest, outcome = RETRYABLE),
+    ErrorRule(exceptions.TelegramServerError, outcome = RETRYABLE),
+    ErrorRule(exceptions.TelegramNetworkError, outcome = RETRYABLE),
+    ErrorRule(exceptions.AiogramError),
+    # aiohttp, timeouts and the like
+    ErrorRule(Exception, outcome = RETRYABLE),
+]
+
+def Classify(error: Exception, rules: list[ErrorRule] = RULES) -> ErrorRule:
+    message = str(error)
+    for rule in rules:
+        if isinstance(error, rule.error_type) and (rule.text is None or rule.text in message):
+            return rule
+    return ErrorRule(Exception)
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff: base_delay * 2 ** (attempt - 1) up to max_delay, minus up to `jitter` of it at random."""
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    jitter: float = 0.5
+
+    def __post_init__(self):
+        if self.max_attempts < 1 or self.base_delay < 0 or self.max_delay < self.base_delay or not 0 <= self.jitter <= 1:
+            raise ValueError(f"wrong retry policy: {self}")
+
+    def GetDelay(self, attempt: int, rng = random) -> float:
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay * (1 - self.jitter * rng.random())
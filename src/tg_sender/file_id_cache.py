@@ -0,0 +1,85 @@
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import weakref
+
+from logger import logging
+
+class FileIdCache:
+    """LRU of telegram file_id by (bot, file path, size, mtime) or (bot, contents hash),
+    file_ids are valid only for the bot that uploaded.
+
+    With `path` set the cache is loaded from and saved to a json file.
+    """
+    def __init__(self, max_size: int = 10000, path: str = None):
+        self.max_size = max_size
+        self.path = path
+        self.entries: collections.OrderedDict[str, str] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # key -> lock held while the file is being uploaded, gone once nobody waits for it
+        self.upload_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+        if self.path is not None and os.path.exists(self.path):
+            self.Load()
+
+    @staticmethod
+    def GetKey(bot_id: str, path: str) -> str:
+        return FileIdCache.GetKeyFromStat(bot_id, path, os.stat(path))
+
+    @staticmethod
+    def GetKeyFromStat(bot_id: str, path: str, stat: os.stat_result) -> str:
+        """The same as GetKey for a stat that was taken elsewhere, e.g. in file_io."""
+        return f"{bot_id}:{stat.st_size}:{stat.st_mtime_ns}:{os.path.abspath(path)}"
+
+    @staticmethod
+    def GetContentKey(bot_id: str, data: bytes) -> str:
+        """Key of a file sent from memory: the same contents are the same file wherever they come from."""
+        return f"{bot_id}:sha256:{hashlib.sha256(data).hexdigest()}"
+
+    def Get(self, key: str):
+        file_id = self.entries.get(key)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return file_id
+
+    def Contains(self, key: str) -> bool:
+        return key in self.entries
+
+    def GetUploadLock(self, key: str) -> asyncio.Lock:
+        lock = self.upload_locks.get(key)
+        if lock is None:
+            lock = self.upload_locks[key] = asyncio.Lock()
+        return lock
+
+    def Put(self, key: str, file_id: str):
+        self.entries[key] = file_id
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+
+    def Invalidate(self, key: str):
+        self.entries.pop(key, None)
+
+    def Load(self):
+        try:
+            with open(self.path, "r") as f:
+                for key, file_id in json.load(f):
+                    self.Put(key, file_id)
+        except (OSError, ValueError) as e:
+            logging.error("can't load file_id cache %s: %s", self.path, e)
+
+    def Save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# enough for a slow network share, few enough to not flood it
+DEFAULT_WORKERS = 8
+
+class FileIO:
+    """Filesystem calls of the senders, run in a bounded thread pool so the event loop never waits on a disk.
+
+    Files up to `prefetch_max_size` bytes are read into memory in the pool before the upload,
+    bigger ones are streamed by aiogram (aiofiles, also off the loop). 0 disables prefetch.
+    """
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, prefetch_max_size: int = 0):
+        if max_workers < 1 or prefetch_max_size < 0:
+            raise ValueError("max_workers must be positive and prefetch_max_size not negative")
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix = "tg_sender_io")
+        self.prefetch_max_size = prefetch_max_size
+
+    @staticmethod
+    def __StatAll(paths):
+        stats = []
+        for path in paths:
+            if isinstance(path, bytes): # contents, nothing to check
+                stats.append(None)
+                continue
+            try:
+                stats.append(os.stat(path))
+            except FileNotFoundError:
+                raise FileNotFoundError(path)
+        return stats
+
+    async def StatAll(self, paths: list[str | bytes]) -> list[os.stat_result]:
+        """os.stat of every path in one trip to the pool, None for contents. Raises FileNotFoundError."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.__StatAll, paths)
+
+    def ShouldPrefetch(self, stat: os.stat_result) -> bool:
+        return stat is not None and 0 < self.prefetch_max_size and stat.st_size <= self.prefetch_max_size
+
+    @staticmethod
+    def __Read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def Read(self, path: str) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.__Read, path)
+
+    def Close(self):
+        self.executor.shutdown(wait = False, cancel_futures = True)
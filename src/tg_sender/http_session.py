@@ -0,0 +1,42 @@
+import ssl
+
+import aiogram
+import aiohttp
+import certifi
+from aiogram.client.session.aiohttp import AiohttpSession
+
+# all bots talk to the same api host, so one pool serves them all
+DEFAULT_LIMIT = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_TIMEOUT = 60
+
+class TunedSession(AiohttpSession):
+    """AiohttpSession whose connector is built here, through the public create_session/close,
+    instead of from aiogram's private connector arguments."""
+    def __init__(self, limit: int, keepalive_timeout: float, dns_cache_ttl: int, timeout: float):
+        super().__init__(limit = limit, timeout = timeout)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.client: aiohttp.ClientSession | None = None
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        if self.client is None or self.client.closed:
+            connector = aiohttp.TCPConnector(
+                limit = self.limit, keepalive_timeout = self.keepalive_timeout, ttl_dns_cache = self.dns_cache_ttl,
+                ssl = ssl.create_default_context(cafile = certifi.where()))
+            self.client = aiohttp.ClientSession(connector = connector,
+                                                headers = {"User-Agent": f"aiogram/{aiogram.__version__}"})
+        return self.client
+
+    async def close(self):
+        if self.client is not None and not self.client.closed:
+            await self.client.close()
+        await super().close()
+
+def CreateSession(limit: int = DEFAULT_LIMIT, keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                  dns_cache_ttl: int = DEFAULT_DNS_CACHE_TTL, timeout: float = DEFAULT_TIMEOUT) -> AiohttpSession:
+    """aiohttp session for Bots: `limit` connections in total, idle ones are kept for `keepalive_timeout` seconds,
+    resolved addresses for `dns_cache_ttl` seconds, `timeout` is per request."""
+    return TunedSession(limit, keepalive_timeout, dns_cache_ttl, timeout)
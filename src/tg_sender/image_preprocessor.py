@@ -0,0 +1,91 @@
+import asyncio
+import collections
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# telegram shows photos up to 2560 px on the long side and recompresses anything bigger
+DEFAULT_MAX_SIDE = 2560
+DEFAULT_FORMAT = "JPEG"
+DEFAULT_QUALITY = 85
+DEFAULT_CACHE_SIZE = 256
+
+def ProcessImage(data: bytes, max_side: int, image_format: str, quality: int) -> bytes:
+    """Downscales the image to max_side and re-encodes it, returns data as is if that does not make it smaller
+    or it is not an image pillow can read (telegram tells what is wrong with it, retries would not help).
+
+    Runs in a worker process.
+    """
+    try:
+        return _ProcessImage(data, max_side, image_format, quality)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data
+
+def _ProcessImage(data: bytes, max_side: int, image_format: str, quality: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format == image_format and max(image.size) <= max_side:
+            return data
+        image.load()
+        if image_format == "JPEG" and image.mode != "RGB":
+            # no alpha in jpeg, transparent parts become white as telegram shows them
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask = rgba.getchannel("A"))
+        resized = max(image.size) > max_side
+        if resized:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, image_format, quality = quality, optimize = True)
+    processed = output.getvalue()
+    if not resized and len(processed) >= len(data):
+        return data
+    return processed
+
+class ImagePreprocessor:
+    """Optional stage before photos are uploaded: downscale and re-encode in a process pool.
+
+    Results are cached by the sha256 of the original contents and the settings.
+    Workers are spawned by default: they start on the first photo, when the process already has threads to fork.
+    """
+    def __init__(self, max_side: int = DEFAULT_MAX_SIDE, image_format: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY,
+                 max_workers: int = None, cache_size: int = DEFAULT_CACHE_SIZE, mp_context: str = "spawn"):
+        if image_format not in ("JPEG", "WEBP"):
+            raise ValueError(f"unsupported format: {image_format}")
+        if max_side < 1 or not 1 <= quality <= 100:
+            raise ValueError("max_side must be positive and quality in 1..100")
+        self.max_side = max_side
+        self.image_format = image_format
+        self.quality = quality
+        self.executor = ProcessPoolExecutor(max_workers, mp_context = multiprocessing.get_context(mp_context))
+        self.cache_size = cache_size
+        self.cache: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def GetSettingsKey(self) -> str:
+        return f"{self.max_side}:{self.image_format}:{self.quality}"
+
+    def GetKey(self, data: bytes) -> str:
+        return f"{hashlib.sha256(data).hexdigest()}:{self.GetSettingsKey()}"
+
+    async def Process(self, data: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        # hashlib releases the GIL on big buffers, a thread is enough
+        key = await loop.run_in_executor(None, self.GetKey, data)
+        processed = self.cache.get(key)
+        if processed is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return processed
+        self.misses += 1
+        processed = await loop.run_in_executor(self.executor, ProcessImage, data, self.max_side, self.image_format, self.quality)
+        self.cache[key] = processed
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last = False)
+        return processed
+
+    def Close(self):
+        self.executor.shutdown(wait = False, cancel_futures = True)
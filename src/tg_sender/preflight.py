@@ -0,0 +1,107 @@
+import html
+import re
+
+import betterproto
+
+from tg_sender import bot
+from tg_sender import tg_sender_api
+
+# Bot API limits, lengths are counted in UTF-16 code units after entities parsing
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+MEDIA_GROUP_MAX = 10
+# ids per deleteMessages/forwardMessages/copyMessages call
+MESSAGE_IDS_MAX = 100
+
+HTML_TAG_REGEX = re.compile(r"<[^>]*>")
+
+class PreflightError(ValueError):
+    """Telegram would reject the task. Not permanent means it can be sent after the fix that was applied."""
+    def __init__(self, message: str, permanent: bool):
+        super().__init__(message)
+        self.permanent = permanent
+
+def Utf16Len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+def ParseMarkdown(text: str):
+    """Returns (visible text, entities are balanced) for an already escaped markdown text."""
+    visible = []
+    opened = set()
+    in_code = None # "`" or "```"
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == "\\" and i + 1 < n:
+            visible.append(text[i + 1])
+            i += 2
+        elif in_code is not None:
+            if text.startswith(in_code, i):
+                i += len(in_code)
+                in_code = None
+            else:
+                visible.append(c)
+                i += 1
+        elif c == "`":
+            in_code = "```" if text.startswith("```", i) else "`"
+            i += len(in_code)
+        elif text.startswith("||", i) or text.startswith("__", i):
+            opened ^= {text[i:i + 2]}
+            i += 2
+        elif c in "*_~":
+            opened ^= {c}
+            i += 1
+        elif c == "[":
+            i += 1
+        elif c == "]" and i + 1 < n and text[i + 1] == "(":
+            # link url is not visible
+            end = text.find(")", i)
+            i = n if end == -1 else end + 1
+        else:
+            visible.append(c)
+            i += 1
+    return "".join(visible), not opened and in_code is None
+
+def GetVisibleText(text: str, parse_mode: str, render = bot.EscapeIfMarkdown):
+    """Same as ParseMarkdown for any parse_mode, html is not checked for balance.
+
+    `render` escapes the text the way SenderBot will, a RenderCache.Render saves escaping it twice.
+    """
+    if not text:
+        return "", True
+    mode = (parse_mode or "").lower()
+    if "markdown" in mode:
+        return ParseMarkdown(render(text, parse_mode))
+    if mode == "html":
+        return html.unescape(HTML_TAG_REGEX.sub("", text)), True
+    return text, True
+
+def CheckText(text: str, parse_mode: str, limit: int, what: str, render = bot.EscapeIfMarkdown):
+    visible, balanced = GetVisibleText(text, parse_mode, render)
+    if not balanced:
+        raise PreflightError(f"can't parse entities in {what}, sending without parse_mode", permanent = False)
+    length = Utf16Len(visible)
+    if length > limit:
+        raise PreflightError(f"{what} is too long: {length} > {limit}", permanent = True)
+
+def CheckTask(task: tg_sender_api.Task, render = bot.EscapeIfMarkdown):
+    """Raises PreflightError for what Telegram would reject anyway, fixes what can be sent differently."""
+    task_name = betterproto.which_one_of(task, "task")[0]
+    parse_mode = task.options.parse_mode
+    if task_name == "send_text":
+        CheckText(task.send_text.text, parse_mode, TEXT_LIMIT, "message", render)
+    elif task_name == "send_markup":
+        CheckText(task.send_markup.text, parse_mode, TEXT_LIMIT, "message", render)
+    elif task_name in ("send_photo", "send_file"):
+        CheckText(getattr(task, task_name).caption, parse_mode, CAPTION_LIMIT, "caption", render)
+    elif task_name == "send_photos":
+        CheckText(task.send_photos.caption, parse_mode, CAPTION_LIMIT, "caption", render)
+        count = len(task.send_photos.paths) + len(task.send_photos.data)
+        if count > MEDIA_GROUP_MAX:
+            raise PreflightError(f"too many photos in a media group: {count} > {MEDIA_GROUP_MAX}", permanent = True)
+        if count == 1:
+            # a media group needs at least 2 items
+            photos = task.send_photos
+            task.send_photo = tg_sender_api.SendPhoto(caption = photos.caption, path = photos.paths[0] if photos.paths else "",
+                                                      data = photos.data[0] if photos.data else b"")
@@ -0,0 +1,86 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+from threading import Lock
+
+# rows of limits that are this long in the past are dropped, checked once per this many batches
+PURGE_AGE = 3600
+PURGE_EVERY = 1000
+
+@dataclass(frozen=True)
+class Request:
+    """One message under a generic cell rate limit named `key`, see rate_policy.RatePolicy."""
+    key: str
+    interval: float
+    tolerance: float
+
+def ReserveGroup(tats: dict[str, float], group: list[Request], now: float):
+    """All or nothing: returns (allowed, ready time of every key), tats is updated only if allowed.
+
+    A key is ready when its theoretical arrival time minus the tolerance has come.
+    """
+    old = [max(tats.get(request.key, now), now) for request in group]
+    allowed = all(tat - request.tolerance <= now for tat, request in zip(old, group))
+    if not allowed:
+        return False, [tat - request.tolerance for tat, request in zip(old, group)]
+    ready_times = []
+    for tat, request in zip(old, group):
+        tats[request.key] = tat + request.interval
+        ready_times.append(tat + request.interval - request.tolerance)
+    return True, ready_times
+
+class MemoryBackend:
+    """Backend of a single process, the stand-in for a shared one in tests and local runs."""
+    def __init__(self):
+        self.tats: dict[str, float] = {}
+        self.lock = Lock()
+
+    def ReserveMany(self, groups: list[list[Request]], now: float = None) -> list[tuple[bool, list[float]]]:
+        """Times are time.time(), a clock that processes of the host share."""
+        with self.lock:
+            now = time.time() if now is None else now
+            return [ReserveGroup(self.tats, group, now) for group in groups]
+
+class SqliteBackend:
+    """Backend shared by every process that opens the same file: one transaction per batch of reservations.
+
+    For processes of one host only: WAL needs shared memory, so the file must be on a local disk,
+    not on NFS or another network filesystem. Times are time.time() of that host.
+    """
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.connection = sqlite3.connect(path, timeout = timeout, isolation_level = None, check_same_thread = False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # losing the last reservations on a power cut costs at most one window of a limit
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        self.lock = Lock()
+        self.batches = 0
+
+    def ReserveMany(self, groups: list[list[Request]], now: float = None) -> list[tuple[bool, list[float]]]:
+        keys = list({request.key for group in groups for request in group})
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so the read-modify-write is atomic between processes
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time() if now is None else now
+                tats = {}
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    tats.update(self.connection.execute(
+                        f"SELECT key, tat FROM rate_limits WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+                before = dict(tats)
+                results = [ReserveGroup(tats, group, now) for group in groups]
+                self.connection.executemany(
+                    "INSERT INTO rate_limits (key, tat) VALUES (?1, ?2) ON CONFLICT(key) DO UPDATE SET tat = ?2",
+                    [(key, tat) for key, tat in tats.items() if before.get(key) != tat])
+                self.batches += 1
+                if self.batches % PURGE_EVERY == 0:
+                    self.connection.execute("DELETE FROM rate_limits WHERE tat < ?", (now - PURGE_AGE,))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return results
+
+    def Close(self):
+        self.connection.close()
@@ -0,0 +1,84 @@
+import time
+from threading import Lock
+
+# Telegram allows about 30 messages per second per bot token, stay a bit under it
+DEFAULT_RATE = 25
+DEFAULT_BURST = 25
+
+# AIMD on flood waits: the rate is cut by this factor on every 429
+# and grows back by base rate / RECOVERY_SUCCESSES per successful send
+DECREASE_FACTOR = 0.5
+MIN_RATE_FACTOR = 0.05
+RECOVERY_SUCCESSES = 100
+
+class TokenBucket:
+    def __init__(self, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # the whole token is on hold until then, see OnFloodWait
+        self.cooldown_until = 0.0
+        self.flood_waits = 0
+        self.successes = 0
+        self.lock = Lock()
+
+    def __Refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def IsReady(self):
+        with self.lock:
+            now = time.monotonic()
+            self.__Refill(now)
+            return self.tokens >= 1 and self.cooldown_until <= now
+
+    def Consume(self):
+        with self.lock:
+            self.__Refill(time.monotonic())
+            self.tokens -= 1
+
+    def GetSecondsUntilReady(self):
+        with self.lock:
+            now = time.monotonic()
+            self.__Refill(now)
+            cooldown = max(self.cooldown_until - now, 0)
+            if self.tokens >= 1:
+                return cooldown
+            return max((1 - self.tokens) / self.rate, cooldown)
+
+    def Hold(self, seconds: float):
+        """Not ready for `seconds`, e.g. another process has spent the budget."""
+        with self.lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def OnFloodWait(self, seconds: float):
+        """Telegram answered 429 with retry_after = seconds: hold the token and slow it down."""
+        with self.lock:
+            now = time.monotonic()
+            self.__Refill(now)
+            self.cooldown_until = max(self.cooldown_until, now + seconds)
+            self.rate = max(self.rate * DECREASE_FACTOR, self.base_rate * MIN_RATE_FACTOR)
+            self.flood_waits += 1
+
+    def OnSuccess(self):
+        with self.lock:
+            self.successes += 1
+            if self.rate < self.base_rate:
+                self.__Refill(time.monotonic())
+                self.rate = min(self.rate + self.base_rate / RECOVERY_SUCCESSES, self.base_rate)
+
+    def GetStats(self):
+        with self.lock:
+            sent = self.flood_waits + self.successes
+            return {
+                "rate": self.rate,
+                "base_rate": self.base_rate,
+                "flood_waits": self.flood_waits,
+                "successes": self.successes,
+                "flood_wait_rate": self.flood_waits / sent if sent else 0.0,
+                "cooldown": max(self.cooldown_until - time.monotonic(), 0),
+            }
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+from tg_sender import tg_sender_api
+
+ChatType = tg_sender_api.ChatType
+
+@dataclass(frozen=True)
+class RatePolicy:
+    """At most `messages` per `seconds` for one (bot, chat), `burst` of them may go back to back.
+
+    Enforced as a generic cell rate algorithm, so ChannelDelay needs a single
+    ready time per chat instead of a log of sent timestamps.
+    """
+    messages: int
+    seconds: float
+    burst: int = 1
+
+    def __post_init__(self):
+        if self.messages < 1 or self.seconds <= 0 or not 1 <= self.burst <= self.messages:
+            raise ValueError(f"wrong rate policy: {self}")
+
+    @property
+    def interval(self):
+        return self.seconds / self.messages
+
+    @property
+    def tolerance(self):
+        return (self.burst - 1) * self.interval
+
+# Telegram: about 1 message per second in a private chat, 20 per minute in a group,
+# channels have no documented per-chat limit. Unknown chats keep the old 1 second delay.
+DEFAULT_POLICIES = {
+    ChatType.CHAT_TYPE_UNKNOWN: RatePolicy(messages = 1, seconds = 1),
+    ChatType.CHAT_TYPE_PRIVATE: RatePolicy(messages = 1, seconds = 1),
+    ChatType.CHAT_TYPE_GROUP: RatePolicy(messages = 20, seconds = 60, burst = 3),
+    ChatType.CHAT_TYPE_CHANNEL: RatePolicy(messages = 2, seconds = 1, burst = 2),
+}
+
+def GetChatType(channel: str, hint: ChatType = ChatType.CHAT_TYPE_UNKNOWN) -> ChatType:
+    if hint:
+        return ChatType(hint)
+    channel = str(channel)
+    if channel.isdigit():
+        return ChatType.CHAT_TYPE_PRIVATE
+    # -100... are supergroups and channels alike, @username is ambiguous too
+    if channel.startswith("-") and not channel.startswith("-100") and channel[1:].isdigit():
+        return ChatType.CHAT_TYPE_GROUP
+    return ChatType.CHAT_TYPE_UNKNOWN
+
+class RatePolicies:
+    def __init__(self, policies: dict[ChatType, RatePolicy] = None):
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        # how long ChannelDelay has to remember a chat after it became ready
+        self.max_tolerance = max(policy.tolerance for policy in self.policies.values())
+
+    def Get(self, channel: str, hint: ChatType = ChatType.CHAT_TYPE_UNKNOWN) -> RatePolicy:
+        return self.policies[GetChatType(channel, hint)]
@@ -0,0 +1,42 @@
+import collections
+from threading import Lock
+
+from tg_sender import bot
+
+class RenderCache:
+    """Bounded LRU of escaped texts by (text, parse_mode), hits and misses help to size it."""
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.entries: collections.OrderedDict[tuple[str, str], str] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def Render(self, text: str, parse_mode: str) -> str:
+        key = (text, parse_mode)
+        with self.lock:
+            rendered = self.entries.get(key)
+            if rendered is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return rendered
+            self.misses += 1
+        rendered = bot.EscapeIfMarkdown(text, parse_mode)
+        if rendered is None or self.max_size <= 0:
+            return rendered
+        with self.lock:
+            self.entries[key] = rendered
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last = False)
+        return rendered
+
+    def GetStats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
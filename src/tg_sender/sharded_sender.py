@@ -0,0 +1,217 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import queue
+
+import betterproto
+
+from logger import logging
+
+from tg_sender import bots
+from tg_sender import task_journal
+from tg_sender import task_stream
+from tg_sender import tg_messages_producer
+from tg_sender import tg_sender_api
+from tg_sender import tg_sender_pb2
+from tg_sender import base_message_to_send
+
+# messages from workers: (kind, shard, ...)
+RESULT_SENT = "sent"        # task bytes, result, journal id
+RESULT_DEAD = "dead"        # task bytes, error text, journal id
+RESULT_ERROR = "error"      # module_folder_name, error text, as on_error gets them
+RESULT_STOPPED = "stopped"
+
+# points per shard on the ring, more is a smoother split
+RING_REPLICAS = 128
+
+def Hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size = 8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing of channels to shards: changing the shard count moves only ~1/N of the channels."""
+    def __init__(self, shards: int, replicas: int = RING_REPLICAS):
+        if shards < 1:
+            raise ValueError("at least one shard")
+        points = sorted((Hash(f"{shard}:{replica}"), shard) for shard in range(shards) for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def GetShard(self, channel: str) -> int:
+        i = bisect.bisect(self.hashes, Hash(str(channel)))
+        return self.shards[i % len(self.shards)]
+
+# what a worker waits for a task before it checks its producer again
+POLL_INTERVAL = 0.5
+NO_TASK = object()
+
+def GetTask(task_queue):
+    try:
+        return task_queue.get(timeout = POLL_INTERVAL)
+    except queue.Empty:
+        return NO_TASK
+
+def MakeBotsOptions(bots_options: dict) -> dict:
+    # callables create in the worker what can't be pickled or shared between processes, e.g. FileIdCache
+    return {name: value() if callable(value) else value for name, value in bots_options.items()}
+
+async def RunShardAsync(shard: int, tokens: list[str], module_folder_name: str, task_queue, result_queue,
+                        producer_options: dict, bots_options: dict = None, journal_path: str = None):
+    journal = task_journal.TaskJournal(journal_path) if journal_path else None
+    # id(task) -> the bytes it came in, results go back as they are; broadcast children and replayed tasks are encoded here
+    originals: dict[int, bytes] = {}
+    def Result(kind, task, value):
+        data = originals.pop(id(task), None)
+        result_queue.put((kind, shard, data if data is not None else bytes(task), value, task.details.journal_id))
+
+    try:
+        async with bots.Bots(tokens, **MakeBotsOptions(bots_options or {})) as senders:
+            producer = tg_messages_producer.MessagesProducer(
+                senders, module_folder_name,
+                on_error = lambda module, text: result_queue.put((RESULT_ERROR, shard, module, text)),
+                on_success = lambda task, result: Result(RESULT_SENT, task, result),
+                on_dead_letter = lambda task, e: Result(RESULT_DEAD, task, str(e)),
+                journal = journal,
+                **producer_options)
+            runner = asyncio.create_task(producer.run())
+            loop = asyncio.get_running_loop()
+            while not runner.done():
+                data = await loop.run_in_executor(None, GetTask, task_queue)
+                if data is NO_TASK:
+                    continue
+                if data is None:
+                    break
+                task = tg_sender_api.Task().parse(data)
+                if betterproto.which_one_of(task, "task")[0] != "broadcast": # results come for its children
+                    originals[id(task)] = data
+                try:
+                    producer.submit(task)
+                except ValueError as e: # submit_bytes does not validate
+                    Result(RESULT_DEAD, task, str(e))
+            # everything that was submitted is sent before the worker goes away, unless run() has failed
+            while (len(producer.message_list) or not producer.queue.empty()) and not runner.done():
+                await asyncio.sleep(0.05)
+            producer.stop()
+            await runner
+            await producer.wait_for_all_tasks()
+    except Exception as e:
+        result_queue.put((RESULT_ERROR, shard, module_folder_name, f"shard {shard} failed: {e!r}"))
+        raise
+    finally:
+        if journal is not None:
+            journal.Close()
+    result_queue.put((RESULT_STOPPED, shard))
+
+def RunShard(*args):
+    """Entry point of a worker process."""
+    asyncio.run(RunShardAsync(*args))
+
+class ShardedSender:
+    """Supervisor of `shards` worker processes, each one runs its own Bots and MessagesProducer.
+
+    Tokens are dealt to the shards round-robin, a channel always goes to the same shard
+    (see HashRing), so the per-channel order and ChannelDelay stay inside one process.
+    Tasks travel to the workers as protobuf bytes; results come back to on_success(task, result),
+    on_error(module_folder_name, text) and on_dead_letter(task, error_text) in the supervisor.
+    The task a callback gets is the one that was submitted, decoded with `decoder` (see task_stream.DECODERS),
+    with details.journal_id of its shard's journal; decoder None passes the bytes as they are.
+
+    bots_options are keyword arguments of every worker's Bots; a callable value is called in the worker,
+    e.g. {"file_ids": file_id_cache.FileIdCache}, for objects that can't be pickled or shared.
+    journal_path, e.g. "tasks-{shard}.db", gives every shard a TaskJournal of its own.
+    """
+    def __init__(self, bot_tokens: list[str], shards: int, module_folder_name: str, on_error, on_success = None,
+                 on_dead_letter = None, producer_options: dict = None, mp_context: str = "spawn",
+                 bots_options: dict = None, journal_path: str = None, decoder: str | None = task_stream.DECODER_BETTERPROTO):
+        if not bot_tokens or not 1 <= shards <= len(bot_tokens):
+            raise ValueError("every shard needs at least one bot token")
+        if journal_path is not None and shards > 1 and "{shard}" not in journal_path:
+            raise ValueError("journal_path needs {shard}: every shard replays its own journal")
+        self.module_folder_name = module_folder_name
+        self.on_error = on_error
+        self.on_success = on_success
+        self.on_dead_letter = on_dead_letter
+        self.decode = task_stream.GetDecoder(decoder) if decoder is not None else None
+        self.ring = HashRing(shards)
+        context = multiprocessing.get_context(mp_context)
+        self.result_queue = context.Queue()
+        self.task_queues = [context.Queue() for _ in range(shards)]
+        self.processes = [
+            context.Process(target = RunShard, name = f"tg_sender_shard_{shard}", daemon = True,
+                            args = (shard, bot_tokens[shard::shards], module_folder_name, self.task_queues[shard],
+                                    self.result_queue, producer_options or {}, bots_options or {},
+                                    journal_path.format(shard = shard) if journal_path else None))
+            for shard in range(shards)]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def submit(self, task: tg_sender_api.Task):
+        base_message_to_send.BaseMessageList.ValidateTask(task)
+        self.submit_bytes(bytes(task))
+
+    def submit_bytes(self, data: bytes):
+        """submit() of a serialized task, e.g. a frame of task_stream.ReadFrames.
+
+        Only the routing fields are decoded, with the protobuf (upb) codec; the workers validate the task
+        and report a wrong one to on_dead_letter.
+        """
+        task = tg_sender_pb2.Task.FromString(data)
+        if task.WhichOneof("task") == "broadcast":
+            for shard, channels in self.__SplitChannels(task.broadcast.channels).items():
+                del task.broadcast.channels[:]
+                task.broadcast.channels.extend(channels)
+                self.task_queues[shard].put(task.SerializeToString())
+            return
+        self.task_queues[self.ring.GetShard(task.channel)].put(data)
+
+    def __Decode(self, data: bytes, journal_id: int):
+        if self.decode is None:
+            return data
+        task = self.decode(data)
+        task.details.journal_id = journal_id
+        return task
+
+    def __SplitChannels(self, channels) -> dict[int, list[str]]:
+        channels_by_shard: dict[int, list[str]] = {}
+        for channel in channels:
+            channels_by_shard.setdefault(self.ring.GetShard(channel), []).append(channel)
+        return channels_by_shard
+
+    def stop(self):
+        """Workers finish what was submitted and exit, run() returns after that."""
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+
+    def __GetResult(self):
+        try:
+            return self.result_queue.get(timeout = 0.5)
+        except queue.Empty:
+            return None
+
+    async def run(self):
+        """Delivers results of the workers to the callbacks until every worker has stopped."""
+        loop = asyncio.get_running_loop()
+        running = set(range(len(self.processes)))
+        while running:
+            message = await loop.run_in_executor(None, self.__GetResult)
+            if message is None:
+                for shard in list(running):
+                    if self.processes[shard].exitcode is not None:
+                        logging.error("shard %d exited with code %s", shard, self.processes[shard].exitcode)
+                        running.discard(shard)
+                continue
+            kind, shard = message[0], message[1]
+            if kind == RESULT_STOPPED:
+                running.discard(shard)
+            elif kind == RESULT_SENT:
+                if self.on_success:
+                    self.on_success(self.__Decode(message[2], message[4]), message[3])
+            elif kind == RESULT_DEAD:
+                if self.on_dead_letter:
+                    self.on_dead_letter(self.__Decode(message[2], message[4]), message[3])
+            elif kind == RESULT_ERROR:
+                self.on_error(message[2], message[3])
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,160 @@
+import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import betterproto
+
+from logger import logging
+
+from tg_sender import tg_sender_api
+
+STATE_QUEUED = 0
+STATE_DISPATCHED = 1
+STATE_DONE = 2
+
+class TaskJournal:
+    """SQLite (WAL) journal of task states, writes are grouped into one transaction = one fsync per batch.
+
+    Records stay in memory until Flush(), which happens when `batch_size` records are buffered
+    or the oldest one is `flush_interval` seconds old (see FlushIfDue). Commits run in a writer thread,
+    one at a time and in order, so the event loop never waits for the fsync.
+    File contents (`data` of the payload) are stored once per payload object in their own table:
+    the children of a broadcast share it, see MessagesProducer.ExpandBroadcast.
+    """
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.05):
+        # used by the writer thread and by Replay/Close after the writes are done, never at the same time
+        self.connection = sqlite3.connect(path, isolation_level = None, check_same_thread = False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                                "id INTEGER PRIMARY KEY, task BLOB NOT NULL, state INTEGER NOT NULL, result INTEGER)")
+        if "payload" not in [column[1] for column in self.connection.execute("PRAGMA table_info(tasks)")]:
+            self.connection.execute("ALTER TABLE tasks ADD COLUMN payload INTEGER")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS payloads (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer: list[tuple] = []
+        # (payload id, payload type, data) to be written with the next batch, serialized in the writer thread
+        self.payload_buffer: list[tuple] = []
+        self.buffered_since = None
+        self.last_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+        self.last_payload_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM payloads").fetchone()[0]
+        # id(payload) -> [payload, payload id, unfinished tasks], journal id -> id(payload)
+        self.payloads: dict[int, list] = {}
+        self.task_payloads: dict[int, int] = {}
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix = "tg_sender_journal")
+
+    def __Record(self, record):
+        if not self.buffer:
+            self.buffered_since = time.monotonic()
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.FlushInBackground()
+
+    def Enqueue(self, task: tg_sender_api.Task):
+        self.last_id += 1
+        task.details.journal_id = self.last_id
+        payload = betterproto.which_one_of(task, "task")[1]
+        if not getattr(payload, "data", None):
+            self.__Record((task.details.journal_id, bytes(task), STATE_QUEUED, None, None))
+            return
+        entry = self.payloads.get(id(payload))
+        if entry is None:
+            self.last_payload_id += 1
+            # the payload is kept alive with its entry, so id(payload) is not reused meanwhile
+            entry = self.payloads[id(payload)] = [payload, self.last_payload_id, 0]
+            self.payload_buffer.append((self.last_payload_id, type(payload), payload.data))
+        entry[2] += 1
+        self.task_payloads[task.details.journal_id] = id(payload)
+        data = payload.data
+        payload.data = type(data)()
+        try:
+            task_bytes = bytes(task)
+        finally:
+            payload.data = data
+        self.__Record((task.details.journal_id, task_bytes, STATE_QUEUED, None, entry[1]))
+
+    def Dispatch(self, task: tg_sender_api.Task):
+        if task.details.journal_id:
+            self.__Record((task.details.journal_id, None, STATE_DISPATCHED, None, None))
+
+    def Result(self, task: tg_sender_api.Task):
+        if task.details.journal_id:
+            self.__Record((task.details.journal_id, None, STATE_DONE, task.details.result, None))
+            key = self.task_payloads.pop(task.details.journal_id, None)
+            if key is not None:
+                entry = self.payloads[key]
+                entry[2] -= 1
+                if entry[2] == 0:
+                    del self.payloads[key]
+
+    def __Write(self, records, payloads):
+        if not records and not payloads:
+            return
+        with self.connection:
+            self.connection.execute("BEGIN")
+            # only data is stored, the rest of the payload is in the task rows
+            self.connection.executemany(
+                "INSERT INTO payloads (id, data) VALUES (?, ?)",
+                [(payload_id, bytes(payload_type(data = data))) for payload_id, payload_type, data in payloads])
+            self.connection.executemany(
+                "INSERT INTO tasks (id, task, state, result, payload) VALUES (?1, ?2, ?3, ?4, ?5) "
+                "ON CONFLICT(id) DO UPDATE SET state = ?3, result = COALESCE(?4, result)",
+                [(journal_id, task_bytes if task_bytes is not None else b"", state, result, payload_id)
+                 for journal_id, task_bytes, state, result, payload_id in records])
+
+    def FlushInBackground(self) -> Future:
+        """Hands the buffered records to the writer thread, the future is done when they and every earlier batch are committed."""
+        records, self.buffer = self.buffer, []
+        payloads, self.payload_buffer = self.payload_buffer, []
+        self.buffered_since = None
+        return self.writer.submit(self.__Write, records, payloads)
+
+    def Flush(self):
+        """Commits the buffered records and waits for it."""
+        self.FlushInBackground().result()
+
+    def GetSecondsUntilFlush(self):
+        if self.buffered_since is None:
+            return None
+        return max(self.buffered_since + self.flush_interval - time.monotonic(), 0)
+
+    def FlushIfDue(self):
+        if self.GetSecondsUntilFlush() == 0:
+            self.FlushInBackground()
+
+    def Replay(self, resend_unconfirmed: bool = True) -> list[tg_sender_api.Task]:
+        """Returns tasks without a result in enqueue order and forgets the finished ones.
+
+        Dispatched tasks without a result may or may not have been delivered,
+        resend_unconfirmed decides whether they are sent again.
+        """
+        self.Flush()
+        states = (STATE_QUEUED, STATE_DISPATCHED) if resend_unconfirmed else (STATE_QUEUED,)
+        tasks = []
+        # payload id -> data, parsed once and shared by the tasks as before the restart
+        payload_data = {}
+        for journal_id, task_bytes, payload_id, data_bytes in self.connection.execute(
+                "SELECT tasks.id, task, payload, payloads.data FROM tasks LEFT JOIN payloads ON payloads.id = payload "
+                f"WHERE state IN ({','.join('?' * len(states))}) ORDER BY tasks.id", states):
+            task = tg_sender_api.Task().parse(task_bytes)
+            task.details = tg_sender_api.TaskDetails(journal_id = journal_id)
+            if payload_id is not None:
+                payload = betterproto.which_one_of(task, "task")[1]
+                if payload_id not in payload_data:
+                    payload_data[payload_id] = type(payload)().parse(data_bytes).data
+                payload.data = payload_data[payload_id]
+            tasks.append(task)
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM tasks WHERE state = ?", (STATE_DONE,))
+            if not resend_unconfirmed:
+                self.connection.execute("DELETE FROM tasks WHERE state = ?", (STATE_DISPATCHED,))
+            self.connection.execute("DELETE FROM payloads WHERE id NOT IN (SELECT payload FROM tasks WHERE payload IS NOT NULL)")
+        logging.info("journal replay: %d tasks to resume", len(tasks))
+        return tasks
+
+    def Close(self):
+        self.Flush()
+        self.writer.shutdown()
+        self.connection.close()
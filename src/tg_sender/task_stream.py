@@ -0,0 +1,132 @@
+import asyncio
+from typing import AsyncIterator, BinaryIO, Iterator
+
+from tg_sender import tg_sender_api
+from tg_sender import tg_sender_pb2
+
+# the same framing as protobuf's writeDelimitedTo/parseDelimitedFrom: varint length, then the message
+DEFAULT_CHUNK_SIZE = 1 << 20
+# a bigger length is a broken stream rather than a task
+MAX_FRAME_SIZE = 64 << 20
+
+DECODER_BETTERPROTO = "betterproto"
+# google.protobuf with the generated tg_sender_pb2, upb (C) in protobuf >= 4
+DECODER_PROTOBUF = "protobuf"
+
+class StreamError(ValueError):
+    pass
+
+def EncodeFrame(data: bytes) -> bytes:
+    size = len(data)
+    prefix = bytearray()
+    while size > 0x7f:
+        prefix.append(size & 0x7f | 0x80)
+        size >>= 7
+    prefix.append(size)
+    return bytes(prefix) + data
+
+def Serialize(task) -> bytes:
+    """Bytes of a Task of either decoder."""
+    return task.SerializeToString() if isinstance(task, tg_sender_pb2.Task) else bytes(task)
+
+def WriteTasks(f: BinaryIO, tasks):
+    f.write(b"".join(EncodeFrame(Serialize(task)) for task in tasks))
+
+class FrameSplitter:
+    """Cuts length-delimited frames out of chunks of a stream, a frame may span any number of chunks."""
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def Feed(self, data: bytes) -> list[bytes]:
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        end = len(buffer)
+        pos = 0
+        while pos < end:
+            size = 0
+            shift = 0
+            i = pos
+            while i < end:
+                byte = buffer[i]
+                i += 1
+                size |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            else: # the length itself is not complete yet
+                break
+            if size > self.max_frame_size:
+                raise StreamError(f"frame of {size} bytes at offset {pos}")
+            if i + size > end:
+                break
+            frames.append(bytes(buffer[i:i + size]))
+            pos = i + size
+        del buffer[:pos]
+        return frames
+
+    def Close(self):
+        if self.buffer:
+            raise StreamError(f"stream ends in the middle of a frame, {len(self.buffer)} bytes left")
+
+def DecodeBetterproto(data: bytes) -> tg_sender_api.Task:
+    return tg_sender_api.Task().parse(data)
+
+def DecodeProtobuf(data: bytes) -> tg_sender_pb2.Task:
+    return tg_sender_pb2.Task.FromString(data)
+
+DECODERS = {
+    DECODER_BETTERPROTO: DecodeBetterproto,
+    DECODER_PROTOBUF: DecodeProtobuf,
+}
+
+def GetDecoder(name: str):
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError(f"unknown decoder: {name}, one of {', '.join(DECODERS)}")
+
+def ReadFrames(f: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Frames of a binary file or pipe as they arrive, the whole stream is never in memory."""
+    splitter = FrameSplitter()
+    # read1 returns what a pipe has now instead of waiting for a full chunk
+    read = getattr(f, "read1", f.read)
+    while data := read(chunk_size):
+        yield from splitter.Feed(data)
+    splitter.Close()
+
+def ReadTasks(f: BinaryIO, decoder: str = DECODER_BETTERPROTO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator:
+    decode = GetDecoder(decoder)
+    for frame in ReadFrames(f, chunk_size):
+        yield decode(frame)
+
+async def AReadFrames(reader: asyncio.StreamReader, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """ReadFrames for a socket or a subprocess pipe."""
+    splitter = FrameSplitter()
+    while data := await reader.read(chunk_size):
+        for frame in splitter.Feed(data):
+            yield frame
+    splitter.Close()
+
+async def AReadTasks(reader: asyncio.StreamReader, decoder: str = DECODER_BETTERPROTO,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator:
+    decode = GetDecoder(decoder)
+    async for frame in AReadFrames(reader, chunk_size):
+        yield decode(frame)
+
+async def SubmitStream(producer, reader: asyncio.StreamReader, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Submits every task of the stream to a MessagesProducer as it arrives, returns how many were submitted.
+
+    The producer works on betterproto tasks; a task it does not accept goes to its on_error and the stream goes on.
+    """
+    submitted = 0
+    async for frame in AReadFrames(reader, chunk_size):
+        task = DecodeBetterproto(frame)
+        try:
+            producer.submit(task)
+        except ValueError as e:
+            producer.ErrorHandler(e, task)
+            continue
+        submitted += 1
+    return submitted
@@ -101,4 +101,61 @@ class TestTGBML:
                 unpin = tg_sender_api.Unpin()
             )
             bml.AddTask(task)
-        assert "no message" in str(ve)
\ No newline at end of file
+        assert "no message" in str(ve)
+
+    async def testStateTransitions(self, mocker):
+        bml = base_message_to_send.BaseMessageList()
+        tasks = [tg_sender_api.Task(channel = channel, send_text = tg_sender_api.SendText(text = "same"))
+                 for channel in ["@first", "@first", "@second"]]
+        bml.AddTasks(tasks)
+        assert len(bml) == 3
+        assert [channel for channel, _ in bml.IterPending()] == ["@first", "@second"]
+        bml.Start(tasks[1])
+        assert list(bml.pending["@first"])[0] is tasks[0]
+        assert len(bml.in_flight) == 1
+        bml.Finish(tasks[1]) # not sent, back to the head
+        assert bml.pending["@first"][0] is tasks[1]
+        bml.Start(tasks[1])
+        tasks[1].details.sent = 1
+        bml.Finish(tasks[1])
+        assert bml.done_count == 1
+        assert len(bml) == 2
+
+    async def testGetSyncsFlags(self, mocker):
+        bml = base_message_to_send.BaseMessageList()
+        tasks = [tg_sender_api.Task(channel = "@first", send_text = tg_sender_api.SendText(text = f"{i}"))
+                 for i in range(3)]
+        bml.AddTasks(tasks)
+        assert bml.Get() == tasks
+        tasks[0].details.in_process = 1
+        tasks[1].details.sent = 1
+        assert bml.Get() == [tasks[2]]
+        tasks[0].details.in_process = 0
+        assert bml.Get() == [tasks[0], tasks[2]]
+        assert bml.done_count == 1
+
+    async def testBroadcastValidation(self, mocker):
+        bml = base_message_to_send.BaseMessageList()
+        with pytest.raises(ValueError) as ve:
+            bml.ValidateTask(tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+                send_text = tg_sender_api.SendText(text = "no channels"))))
+        assert "no channels" in str(ve)
+        with pytest.raises(ValueError) as ve:
+            bml.ValidateTask(tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(channels = ["@first"])))
+        assert "no broadcast payload" in str(ve)
+        with pytest.raises(ValueError) as ve:
+            bml.AddTask(tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+                channels = ["@first"], send_text = tg_sender_api.SendText(text = "text"))))
+        assert "expanded" in str(ve)
+
+    def testDescribeTask(self):
+        data = b"\x89PNG" * 1000
+        task = tg_sender_api.Task(channel = "@files", send_photos = tg_sender_api.SendPhotos(data = [data, b"1"]))
+        description = base_message_to_send.DescribeTask(task)
+        assert "<4000 bytes>" in description and "<1 bytes>" in description
+        assert "PNG" not in description
+        assert task.send_photos.data == [data, b"1"]
+        broadcast = tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+            channels = ["@a"], send_file = tg_sender_api.SendFile(data = data, filename = "f.png")))
+        assert "<4000 bytes>" in base_message_to_send.DescribeTask(broadcast)
+        assert broadcast.broadcast.send_file.data == data
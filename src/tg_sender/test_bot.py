@@ -0,0 +1,15 @@
+import pytest
+from tg_sender import bot
+
+def testEscapeIfMarkdown():
+    assert bot.EscapeIfMarkdown("1.5 (up) [google](https://www.google.com/?a=b-c) done!", "MarkdownV2") == \
+        "1\\.5 \\(up\\) [google](https://www.google.com/?a=b-c) done\\!"
+    assert bot.EscapeIfMarkdown("[a.b](x.y)[c](z)", "MarkdownV2") == "[a\\.b](x.y)[c](z)"
+    assert bot.EscapeIfMarkdown("\x00[a](b).", "markdown") == "\x00[a](b)\\."
+    assert bot.EscapeIfMarkdown("[not a link] (x)", "MarkdownV2") == "\\[not a link\\] \\(x\\)"
+    assert bot.EscapeIfMarkdown("1.5", "HTML") == "1.5"
+    assert bot.EscapeIfMarkdown("", "MarkdownV2") == ""
+
+def testSplitLinks():
+    assert bot.SplitLinks("a [b](c) d") == ["a ", "[", "b", "](c)", " d"]
+    assert bot.SplitLinks("no links") == ["no links"]
@@ -0,0 +1,77 @@
+import pytest
+from tg_sender import bots
+from tg_sender import http_session
+
+FAKE_TOKENS = ["123456:AAAA", "654321:BBBB", "111111:CCCC"]
+
+async def testGetFreeBotIndex():
+    channel = "@testGetFreeBotIndex"
+    async with bots.Bots(FAKE_TOKENS) as senders:
+        assert senders.GetSecondsUntilReady(channel) == 0
+        used = set()
+        for _ in FAKE_TOKENS:
+            free_bot, channel_delay = senders.GetFreeBot(channel)
+            assert free_bot is not None
+            used.add(free_bot.token)
+            channel_delay.UpdateChannelReady(channel, 10)
+        assert used == set(FAKE_TOKENS)
+        assert senders.GetFreeBot(channel) == (None, None)
+        assert 9 < senders.GetSecondsUntilReady(channel) <= 10
+        # other channels are not affected
+        assert senders.GetFreeBot("@other")[0] is not None
+
+async def testGetFreeBotReleased():
+    channel = "@testGetFreeBotReleased"
+    async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+        for _ in range(10):
+            free_bot, channel_delay = senders.GetFreeBot(channel)
+            assert free_bot is not None
+            channel_delay.UpdateChannelReady(channel, 0)
+
+async def testGetFreeBotRespectsTokenBucket():
+    async with bots.Bots(FAKE_TOKENS[:2], rate = 1, burst = 1) as senders:
+        for channel in ["@first", "@second"]:
+            free_bot, channel_delay = senders.GetFreeBot(channel)
+            assert free_bot is not None
+            channel_delay.UpdateChannelReady(channel)
+            free_bot.rate_limiter.Consume()
+        # both bots spent their budget, channel delays do not matter
+        assert senders.GetFreeBot("@third") == (None, None)
+        assert senders.GetFreeBot("@first") == (None, None)
+        assert 0.9 < senders.GetSecondsUntilReady("@third") <= 1
+
+async def testGetSecondsUntilReadyOfServingBots():
+    async with bots.Bots(FAKE_TOKENS[:2], rate = 1, burst = 1) as senders:
+        busy, busy_delay = senders.GetFreeBot("@channel")
+        busy_delay.UpdateChannelReady("@channel", 10)
+        spent, _ = senders.GetFreeBot("@channel")
+        assert spent is not busy
+        spent.rate_limiter.Consume()
+        # the bot that has tokens is busy in the channel, the free one waits for a token
+        assert 0.9 < senders.GetSecondsUntilReady("@channel") <= 1
+
+async def testGetFreeBotSkipsFloodWait():
+    async with bots.Bots(FAKE_TOKENS[:2]) as senders:
+        free_bot, _ = senders.GetFreeBot("@first")
+        free_bot.rate_limiter.OnFloodWait(5)
+        # the other token takes over every channel
+        for channel in ["@first", "@second"]:
+            other, _ = senders.GetFreeBot(channel)
+            assert other is not None and other is not free_bot
+        stats = senders.GetStats()[free_bot.bot.id]
+        assert stats["flood_waits"] == 1 and 4 < stats["cooldown"] <= 5
+
+async def testSharedSession():
+    session = http_session.CreateSession(limit = 10, keepalive_timeout = 5, dns_cache_ttl = 60, timeout = 3)
+    async with bots.Bots(FAKE_TOKENS, session = session) as senders:
+        used = {senders.GetFreeBot(f"@{i}")[0].bot.session for i in range(3)}
+        assert used == {session}
+        aiohttp_session = await session.create_session()
+        assert aiohttp_session.connector.limit == 10
+    # the caller's session stays open, the one Bots created itself is closed
+    assert not aiohttp_session.closed
+    await session.close()
+    assert aiohttp_session.closed
+    async with bots.Bots(FAKE_TOKENS) as senders:
+        own_session = await senders.session.create_session()
+    assert own_session.closed
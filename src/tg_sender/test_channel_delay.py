@@ -12,3 +12,14 @@ def testChannelDelay():
     assert cd.IsChannelReady(channel) == 0
     time.sleep(0.6)
     assert cd.IsChannelReady(channel) == 1
+
+
+def testChannelDelayEviction():
+    cd = channel_delay.ChannelDelay()
+    for i in range(channel_delay.SWEEP_MIN_UPDATES):
+        cd.UpdateChannelReady(f"expired-{i}", 0)
+    cd.UpdateChannelReady("alive", 10)
+    assert len(cd) == 1
+    assert cd.IsChannelReady("expired-0") == 1
+    assert cd.IsChannelReady("alive") == 0
+    assert 9 < cd.GetSecondsUntilReady("alive") <= 10
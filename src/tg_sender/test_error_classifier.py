@@ -0,0 +1,28 @@
+import random
+import pytest
+from aiogram import exceptions
+from tg_sender import error_classifier
+from tg_sender import tg_sender_api
+
+def testClassify():
+    rule = error_classifier.Classify(exceptions.TelegramBadRequest(None, "Bad Request: can't parse entities"))
+    assert rule.outcome == error_classifier.FIX_THEN_RETRY
+    task = tg_sender_api.Task(options = tg_sender_api.MessageOptions(parse_mode = "MarkdownV2"))
+    rule.fix(task)
+    assert not task.options.parse_mode
+    assert error_classifier.Classify(exceptions.TelegramBadRequest(None, "chat not found")).outcome == error_classifier.PERMANENT
+    assert error_classifier.Classify(exceptions.TelegramServerError(None, "Bad Gateway")).outcome == error_classifier.RETRYABLE
+    # a subclass of the network error, but retrying it won't help
+    assert error_classifier.Classify(exceptions.TelegramEntityTooLarge(None, "too large")).outcome == error_classifier.PERMANENT
+    flood = error_classifier.Classify(exceptions.TelegramRetryAfter(None, "Flood control", 3))
+    assert flood.outcome == error_classifier.RETRYABLE and not flood.counts_attempt
+    assert error_classifier.Classify(TimeoutError()).outcome == error_classifier.RETRYABLE
+
+def testRetryPolicy():
+    policy = error_classifier.RetryPolicy(base_delay = 1, max_delay = 10, jitter = 0.5)
+    rng = random.Random(1)
+    for attempt, full in [(1, 1), (2, 2), (3, 4), (10, 10)]:
+        delay = policy.GetDelay(attempt, rng)
+        assert full / 2 <= delay <= full
+    with pytest.raises(ValueError):
+        error_classifier.RetryPolicy(max_attempts = 0)
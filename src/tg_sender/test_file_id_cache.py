@@ -0,0 +1,65 @@
+import os
+import pytest
+import tempfile
+import aiogram
+from unittest import mock
+
+from tg_sender import bot
+from tg_sender import base_message_data
+from tg_sender import file_id_cache
+
+def testLRU():
+    cache = file_id_cache.FileIdCache(max_size = 2)
+    cache.Put("a", "file_a")
+    cache.Put("b", "file_b")
+    assert cache.Get("a") == "file_a"
+    cache.Put("c", "file_c") # b is the least recently used
+    assert cache.Get("b") is None
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def testPersistence():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "file_ids.json")
+        cache = file_id_cache.FileIdCache(path = path)
+        cache.Put("a", "file_a")
+        cache.Save()
+        assert file_id_cache.FileIdCache(path = path).Get("a") == "file_a"
+
+async def testSendPhotoUsesFileId():
+    uploaded = []
+    async def send_photo(*args, **kwargs):
+        uploaded.append(kwargs["photo"])
+        message = mock.MagicMock()
+        message.photo[-1].file_id = "cached_file_id"
+        return message
+
+    with tempfile.NamedTemporaryFile() as tmp, \
+            mock.patch.object(aiogram.Bot, 'send_photo', side_effect = send_photo):
+        sender = bot.SenderBot("123456:AAAA", file_ids = file_id_cache.FileIdCache())
+        bmd = base_message_data.BaseMessageDataBuilder.create("@channel").build()
+        await sender.SendPhoto(bmd, tmp.name)
+        await sender.SendPhoto(bmd, tmp.name)
+        await sender.bot.session.close()
+    assert isinstance(uploaded[0], aiogram.types.FSInputFile)
+    assert uploaded[1] == "cached_file_id"
+
+async def testSendPhotoFromBytes():
+    uploaded = []
+    async def send_photo(*args, **kwargs):
+        uploaded.append(kwargs["photo"])
+        message = mock.MagicMock()
+        message.photo[-1].file_id = "cached_file_id"
+        return message
+
+    with mock.patch.object(aiogram.Bot, 'send_photo', side_effect = send_photo):
+        sender = bot.SenderBot("123456:AAAA", file_ids = file_id_cache.FileIdCache())
+        bmd = base_message_data.BaseMessageDataBuilder.create("@channel").build()
+        await sender.SendPhoto(bmd, b"chart")
+        # equal contents are the same file
+        await sender.SendPhoto(bmd, bytes(b"chart"))
+        await sender.SendPhoto(bmd, b"other chart")
+        await sender.bot.session.close()
+    assert isinstance(uploaded[0], aiogram.types.BufferedInputFile)
+    assert uploaded[1] == "cached_file_id"
+    assert isinstance(uploaded[2], aiogram.types.BufferedInputFile)
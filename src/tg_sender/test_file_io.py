@@ -0,0 +1,41 @@
+import os
+import pytest
+import tempfile
+import aiogram
+from unittest import mock
+
+from tg_sender import bot
+from tg_sender import base_message_data
+from tg_sender import file_io
+
+async def testStatAll():
+    io = file_io.FileIO(max_workers = 2)
+    with tempfile.NamedTemporaryFile() as tmp:
+        tmp.write(b"abc")
+        tmp.flush()
+        stats = await io.StatAll([tmp.name, b"contents"])
+        assert stats[0].st_size == 3 and stats[1] is None
+        with pytest.raises(FileNotFoundError):
+            await io.StatAll([tmp.name, tmp.name + ".missing"])
+    io.Close()
+
+async def testPrefetch():
+    uploaded = []
+    async def send_document(*args, **kwargs):
+        uploaded.append(kwargs["document"])
+        return mock.MagicMock()
+
+    with tempfile.NamedTemporaryFile(suffix = ".csv") as tmp, \
+            mock.patch.object(aiogram.Bot, 'send_document', side_effect = send_document):
+        tmp.write(b"a,b")
+        tmp.flush()
+        sender = bot.SenderBot("123456:AAAA", file_io = file_io.FileIO(prefetch_max_size = 3))
+        bmd = base_message_data.BaseMessageDataBuilder.create("@channel").build()
+        await sender.SendFile(bmd, tmp.name)
+        sender.file_io.prefetch_max_size = 2
+        await sender.SendFile(bmd, tmp.name)
+        await sender.bot.session.close()
+        sender.file_io.Close()
+    assert isinstance(uploaded[0], aiogram.types.BufferedInputFile)
+    assert uploaded[0].data == b"a,b" and uploaded[0].filename == os.path.basename(tmp.name)
+    assert isinstance(uploaded[1], aiogram.types.FSInputFile)
@@ -0,0 +1,76 @@
+import io
+import pytest
+import aiogram
+from unittest import mock
+from PIL import Image
+
+from tg_sender import bot
+from tg_sender import base_message_data
+from tg_sender import file_id_cache
+from tg_sender import image_preprocessor
+
+def MakeImage(size, image_format, mode = "RGB"):
+    output = io.BytesIO()
+    Image.new(mode, size, "red").save(output, image_format)
+    return output.getvalue()
+
+def testProcessImage():
+    png = MakeImage((4000, 1000), "PNG", "RGBA")
+    processed = image_preprocessor.ProcessImage(png, 2560, "JPEG", 85)
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.format == "JPEG" and image.size == (2560, 640)
+    # already fine
+    jpeg = MakeImage((100, 100), "JPEG")
+    assert image_preprocessor.ProcessImage(jpeg, 2560, "JPEG", 85) is jpeg
+    webp = image_preprocessor.ProcessImage(png, 1000, "WEBP", 80)
+    with Image.open(io.BytesIO(webp)) as image:
+        assert image.format == "WEBP" and image.size == (1000, 250)
+
+def testProcessImageUnreadable():
+    data = b"not an image"
+    assert image_preprocessor.ProcessImage(data, 2560, "JPEG", 85) is data
+
+async def testSendPhotoPreprocessed():
+    uploaded = []
+    async def send_photo(*args, **kwargs):
+        uploaded.append(kwargs["photo"])
+        return mock.MagicMock()
+
+    preprocessor = image_preprocessor.ImagePreprocessor(max_side = 500, max_workers = 1)
+    with mock.patch.object(aiogram.Bot, 'send_photo', side_effect = send_photo):
+        sender = bot.SenderBot("123456:AAAA", image_preprocessor = preprocessor)
+        bmd = base_message_data.BaseMessageDataBuilder.create("@channel").build()
+        png = MakeImage((1000, 1000), "PNG")
+        await sender.SendPhoto(bmd, png)
+        await sender.SendPhoto(bmd, png)
+        await sender.bot.session.close()
+        sender.file_io.Close()
+    preprocessor.Close()
+    with Image.open(io.BytesIO(uploaded[0].data)) as image:
+        assert image.size == (500, 500)
+    assert (preprocessor.hits, preprocessor.misses) == (1, 1)
+
+async def testCachedPhotoNotPreprocessed(tmp_path):
+    async def send_photo(*args, **kwargs):
+        message = mock.MagicMock()
+        message.photo[-1].file_id = "file_id"
+        return message
+
+    path = tmp_path / "photo.png"
+    path.write_bytes(MakeImage((1000, 1000), "PNG"))
+    preprocessor = image_preprocessor.ImagePreprocessor(max_side = 500, max_workers = 1)
+    with mock.patch.object(aiogram.Bot, 'send_photo', side_effect = send_photo) as sent:
+        sender = bot.SenderBot("123456:AAAA", file_ids = file_id_cache.FileIdCache(), image_preprocessor = preprocessor)
+        bmd = base_message_data.BaseMessageDataBuilder.create("@channel").build()
+        for _ in range(3):
+            await sender.SendPhoto(bmd, str(path))
+        await sender.bot.session.close()
+        sender.file_io.Close()
+    preprocessor.Close()
+    # found by the stat of the original, never read or hashed again
+    assert (preprocessor.hits, preprocessor.misses) == (0, 1)
+    assert [call.kwargs["photo"] for call in sent.call_args_list[1:]] == ["file_id", "file_id"]
+
+def testWrongSettings():
+    with pytest.raises(ValueError):
+        image_preprocessor.ImagePreprocessor(image_format = "GIF")
@@ -0,0 +1,40 @@
+import pytest
+from tg_sender import preflight
+from tg_sender import tg_sender_api
+
+def MakeTask(text, parse_mode = "MarkdownV2"):
+    return tg_sender_api.Task(
+        channel = "@x",
+        options = tg_sender_api.MessageOptions(parse_mode = parse_mode),
+        send_text = tg_sender_api.SendText(text = text)
+    )
+
+def testUtf16Len():
+    assert preflight.Utf16Len("abc") == 3
+    # astral plane characters take two code units
+    assert preflight.Utf16Len("😀") == 2
+
+def testVisibleText():
+    visible, balanced = preflight.GetVisibleText("*bold* [link](https://a.b/c) 1.5 `co_de`", "MarkdownV2")
+    assert (visible, balanced) == ("bold link 1.5 co_de", True)
+    assert preflight.GetVisibleText("can't_parse```", "MarkdownV2")[1] is False
+    assert preflight.GetVisibleText("<b>a&amp;b</b>", "HTML") == ("a&b", True)
+
+def testCheckTask():
+    preflight.CheckTask(MakeTask("*ok*"))
+    # markup does not count towards the limit
+    preflight.CheckTask(MakeTask("*" + "a" * preflight.TEXT_LIMIT + "*"))
+    with pytest.raises(preflight.PreflightError) as e:
+        preflight.CheckTask(MakeTask("😀" * (preflight.TEXT_LIMIT // 2 + 1), None))
+    assert e.value.permanent
+    with pytest.raises(preflight.PreflightError) as e:
+        preflight.CheckTask(MakeTask("can't_parse"))
+    assert not e.value.permanent
+
+def testCheckMediaGroup():
+    task = tg_sender_api.Task(channel = "@x", send_photos = tg_sender_api.SendPhotos(caption = "c", paths = ["a.png"]))
+    preflight.CheckTask(task)
+    assert task.send_photo.path == "a.png"
+    task.send_photos = tg_sender_api.SendPhotos(paths = ["a.png"] * (preflight.MEDIA_GROUP_MAX + 1))
+    with pytest.raises(preflight.PreflightError):
+        preflight.CheckTask(task)
@@ -0,0 +1,40 @@
+import os
+import tempfile
+from tg_sender import rate_backend
+
+def Group(*keys):
+    return [rate_backend.Request(key, interval = 1, tolerance = 0) for key in keys]
+
+def testReserveGroupAllOrNothing():
+    tats = {}
+    assert rate_backend.ReserveGroup(tats, Group("bot:@a", "bot"), 100) == (True, [101, 101])
+    assert tats == {"bot:@a": 101, "bot": 101}
+    # the bot is busy, the other channel is not reserved either
+    allowed, ready_times = rate_backend.ReserveGroup(tats, Group("bot:@b", "bot"), 100.5)
+    assert not allowed and ready_times == [100.5, 101]
+    assert "bot:@b" not in tats
+    assert rate_backend.ReserveGroup(tats, Group("bot:@b", "bot"), 101)[0]
+
+def testReserveGroupTolerance():
+    tats = {}
+    burst = [rate_backend.Request("bot", interval = 1, tolerance = 2)]
+    assert [rate_backend.ReserveGroup(tats, burst, 100)[0] for _ in range(4)] == [True, True, True, False]
+
+def testMemoryBackend():
+    backend = rate_backend.MemoryBackend()
+    results = backend.ReserveMany([Group("bot:@a", "bot"), Group("bot:@b", "bot")], now = 100)
+    assert [allowed for allowed, _ in results] == [True, False]
+
+def testSqliteBackendShared():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "limits.db")
+        first, second = rate_backend.SqliteBackend(path), rate_backend.SqliteBackend(path)
+        try:
+            assert first.ReserveMany([Group("bot:@a", "bot")], now = 100)[0][0]
+            # the other connection sees the reservation
+            assert second.ReserveMany([Group("bot:@b", "bot")], now = 100.5) == [(False, [100.5, 101])]
+            assert second.ReserveMany([Group("bot:@b", "bot")], now = 101)[0][0]
+            assert not first.ReserveMany([Group("bot:@c", "bot")], now = 101.5)[0][0]
+        finally:
+            first.Close()
+            second.Close()
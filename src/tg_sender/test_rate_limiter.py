@@ -0,0 +1,31 @@
+import pytest
+import time
+from tg_sender import rate_limiter
+
+def testTokenBucket():
+    bucket = rate_limiter.TokenBucket(rate = 10, burst = 3)
+    for _ in range(3):
+        assert bucket.IsReady()
+        bucket.Consume()
+    assert not bucket.IsReady()
+    assert 0 < bucket.GetSecondsUntilReady() <= 0.1
+    time.sleep(0.11)
+    assert bucket.IsReady()
+
+def testTokenBucketWrongArgs():
+    with pytest.raises(ValueError):
+        rate_limiter.TokenBucket(rate = 0)
+
+def testTokenBucketFloodWait():
+    bucket = rate_limiter.TokenBucket(rate = 10, burst = 3)
+    bucket.OnFloodWait(0.1)
+    assert not bucket.IsReady()
+    assert 0 < bucket.GetSecondsUntilReady() <= 0.1
+    assert bucket.rate == 10 * rate_limiter.DECREASE_FACTOR
+    time.sleep(0.11)
+    assert bucket.IsReady()
+    for _ in range(rate_limiter.RECOVERY_SUCCESSES):
+        bucket.OnSuccess()
+    assert bucket.rate == 10
+    stats = bucket.GetStats()
+    assert stats["flood_waits"] == 1 and stats["flood_wait_rate"] == 1 / (1 + rate_limiter.RECOVERY_SUCCESSES)
@@ -0,0 +1,31 @@
+import pytest
+from tg_sender import channel_delay
+from tg_sender import rate_policy
+
+ChatType = rate_policy.ChatType
+
+def testGetChatType():
+    assert rate_policy.GetChatType("12345") == ChatType.CHAT_TYPE_PRIVATE
+    assert rate_policy.GetChatType("-12345") == ChatType.CHAT_TYPE_GROUP
+    assert rate_policy.GetChatType("-10012345") == ChatType.CHAT_TYPE_UNKNOWN
+    assert rate_policy.GetChatType("@channel") == ChatType.CHAT_TYPE_UNKNOWN
+    assert rate_policy.GetChatType("@channel", ChatType.CHAT_TYPE_CHANNEL) == ChatType.CHAT_TYPE_CHANNEL
+
+def testWrongPolicy():
+    with pytest.raises(ValueError):
+        rate_policy.RatePolicy(messages = 2, seconds = 1, burst = 3)
+
+def testGroupPolicyBurst():
+    policy = rate_policy.RatePolicy(messages = 20, seconds = 60, burst = 3)
+    cd = channel_delay.ChannelDelay(eviction_delay = policy.tolerance)
+    for _ in range(3):
+        assert cd.IsChannelReady("-123") == 1
+        cd.UpdateChannelReady("-123", policy = policy)
+    assert cd.IsChannelReady("-123") == 0
+    assert 2.9 < cd.GetSecondsUntilReady("-123") <= 3
+
+def testPoliciesOverride():
+    policies = rate_policy.RatePolicies({ChatType.CHAT_TYPE_PRIVATE: rate_policy.RatePolicy(messages = 2, seconds = 1)})
+    assert policies.Get("12345").messages == 2
+    assert policies.Get("-12345") == rate_policy.DEFAULT_POLICIES[ChatType.CHAT_TYPE_GROUP]
+    assert policies.max_tolerance == rate_policy.DEFAULT_POLICIES[ChatType.CHAT_TYPE_GROUP].tolerance
@@ -0,0 +1,13 @@
+import pytest
+from tg_sender import render_cache
+
+def testRenderCache():
+    cache = render_cache.RenderCache(max_size = 2)
+    assert cache.Render("1.5", "MarkdownV2") == "1\\.5"
+    assert cache.Render("1.5", "MarkdownV2") == "1\\.5"
+    # parse_mode is a part of the key, a retry without markdown renders again
+    assert cache.Render("1.5", None) == "1.5"
+    cache.Render("2.5", "MarkdownV2")
+    stats = cache.GetStats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 3, 2)
+    assert stats["hit_rate"] == 0.25
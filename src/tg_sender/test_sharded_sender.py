@@ -0,0 +1,91 @@
+import aiogram
+import asyncio
+import os
+import pytest
+import queue
+from unittest import mock
+
+from tg_sender import file_id_cache
+from tg_sender import sharded_sender
+from tg_sender import tg_messages_producer
+from tg_sender import tg_sender_api
+
+FAKE_TOKENS = ["123456:AAAA", "654321:BBBB", "111111:CCCC"]
+
+def testHashRing():
+    ring = sharded_sender.HashRing(4)
+    channels = [f"@channel{i}" for i in range(2000)]
+    shards = [ring.GetShard(channel) for channel in channels]
+    assert shards == [ring.GetShard(channel) for channel in channels]
+    assert all(300 < shards.count(shard) < 700 for shard in range(4))
+    # one more shard moves only the channels it takes over
+    bigger = sharded_sender.HashRing(5)
+    moved = [channel for channel, shard in zip(channels, shards) if bigger.GetShard(channel) != shard]
+    assert all(bigger.GetShard(channel) == 4 for channel in moved)
+    assert len(moved) < 700
+
+def testWrongShards():
+    with pytest.raises(ValueError):
+        sharded_sender.ShardedSender(FAKE_TOKENS, 4, "test", mock.MagicMock())
+
+def testSubmitBytes():
+    sender = sharded_sender.ShardedSender(FAKE_TOKENS, 2, "test", mock.MagicMock(), mp_context = "fork")
+    task = tg_sender_api.Task(channel = "@single", send_text = tg_sender_api.SendText(text = "hi"))
+    sender.submit_bytes(bytes(task))
+    assert sender.task_queues[sender.ring.GetShard("@single")].get(timeout = 1) == bytes(task)
+    channels = [f"@channel{i}" for i in range(10)]
+    sender.submit_bytes(bytes(tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+        channels = channels, send_text = tg_sender_api.SendText(text = "all")))))
+    for shard, task_queue in enumerate(sender.task_queues):
+        part = tg_sender_api.Task().parse(task_queue.get(timeout = 1))
+        assert part.broadcast.send_text.text == "all"
+        assert part.broadcast.channels == [channel for channel in channels if sender.ring.GetShard(channel) == shard]
+
+def testJournalPathPerShard():
+    with pytest.raises(ValueError):
+        sharded_sender.ShardedSender(FAKE_TOKENS, 2, "test", mock.MagicMock(), journal_path = "tasks.db")
+
+async def testShardFailureReported():
+    task_queue, result_queue = queue.Queue(), queue.Queue()
+    with mock.patch.object(tg_messages_producer.MessagesProducer, "run", side_effect = RuntimeError("broken")):
+        with pytest.raises(RuntimeError):
+            # nothing is submitted and stop() never comes, the worker still has to notice
+            await asyncio.wait_for(sharded_sender.RunShardAsync(0, FAKE_TOKENS[:1], "test", task_queue, result_queue, {}), 5)
+    kind, shard, module, text = result_queue.get_nowait()
+    assert kind == sharded_sender.RESULT_ERROR and "broken" in text
+
+async def testShardedSendOptions(tmp_path):
+    with mock.patch.object(aiogram.Bot, 'send_message', return_value = mock.MagicMock(message_id = 1)):
+        sent = []
+        sender = sharded_sender.ShardedSender(FAKE_TOKENS, 2, "test", mock.MagicMock(),
+                                              on_success = lambda task, result: sent.append(task),
+                                              mp_context = "fork", bots_options = {"file_ids": file_id_cache.FileIdCache, "rate": 10},
+                                              journal_path = str(tmp_path / "tasks-{shard}.db"), decoder = None)
+        sender.start()
+        tasks = [bytes(tg_sender_api.Task(channel = f"@channel{i}", send_text = tg_sender_api.SendText(text = "hi")))
+                 for i in range(6)]
+        for task in tasks:
+            sender.submit_bytes(task)
+        sender.stop()
+        await sender.run()
+    # the submitted bytes come back as they are
+    assert sorted(sent) == sorted(tasks)
+    assert all(os.path.exists(tmp_path / f"tasks-{shard}.db") for shard in range(2))
+
+async def testShardedSend():
+    # fork keeps the mock in the workers
+    with mock.patch.object(aiogram.Bot, 'send_message', return_value = mock.MagicMock(message_id = 1)):
+        sent = []
+        sender = sharded_sender.ShardedSender(FAKE_TOKENS, 2, "test", mock.MagicMock(),
+                                              on_success = lambda task, result: sent.append(task.channel),
+                                              mp_context = "fork")
+        sender.start()
+        channels = [f"@channel{i}" for i in range(10)]
+        for channel in channels:
+            sender.submit(tg_sender_api.Task(channel = channel, send_text = tg_sender_api.SendText(text = "hi")))
+        sender.submit(tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+            channels = ["@a", "@b", "@c"], send_text = tg_sender_api.SendText(text = "all"))))
+        sender.stop()
+        await sender.run()
+    assert sorted(sent) == sorted(channels + ["@a", "@b", "@c"])
+    assert all(process.exitcode == 0 for process in sender.processes)
@@ -0,0 +1,88 @@
+import os
+import pytest
+import tempfile
+
+from tg_sender import task_journal
+from tg_sender import tg_sender_api
+
+def MakeTasks(count):
+    return [tg_sender_api.Task(channel = "@journal", send_text = tg_sender_api.SendText(text = f"{i}"))
+            for i in range(count)]
+
+def WriteJournal(path):
+    journal = task_journal.TaskJournal(path, batch_size = 2)
+    tasks = MakeTasks(3)
+    for task in tasks:
+        journal.Enqueue(task)
+    journal.Dispatch(tasks[0])
+    journal.Dispatch(tasks[1])
+    tasks[0].details.sent = 1
+    tasks[0].details.result = 42
+    journal.Result(tasks[0])
+    journal.Close()
+
+def testReplay():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "journal.db")
+        WriteJournal(path)
+        journal = task_journal.TaskJournal(path)
+        tasks = journal.Replay()
+        assert [task.send_text.text for task in tasks] == ["1", "2"]
+        assert not tasks[0].details.in_process
+        # ids continue after the replayed ones
+        new_task = MakeTasks(1)[0]
+        journal.Enqueue(new_task)
+        assert new_task.details.journal_id == 4
+        journal.Close()
+
+def testReplayWithoutUnconfirmed():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "journal.db")
+        WriteJournal(path)
+        journal = task_journal.TaskJournal(path)
+        assert [task.send_text.text for task in journal.Replay(resend_unconfirmed = False)] == ["2"]
+        journal.Close()
+
+def testFlushInBackground():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "journal.db")
+        journal = task_journal.TaskJournal(path, batch_size = 100)
+        for task in MakeTasks(3):
+            journal.Enqueue(task)
+        journal.FlushInBackground().result()
+        assert not journal.buffer
+        # committed: another connection sees the tasks
+        other = task_journal.TaskJournal(path)
+        assert len(other.Replay()) == 3
+        other.Close()
+        journal.Close()
+
+def testPayloadStoredOnce():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "journal.db")
+        journal = task_journal.TaskJournal(path)
+        # children of a broadcast share the payload
+        photo = tg_sender_api.SendPhoto(data = b"x" * 10000, caption = "photo")
+        tasks = [tg_sender_api.Task(channel = f"@journal-{i}", send_photo = photo) for i in range(3)]
+        tasks.append(tg_sender_api.Task(channel = "@journal", send_photos = tg_sender_api.SendPhotos(data = [b"a", b"b"])))
+        for task in tasks:
+            journal.Enqueue(task)
+        assert photo.data == b"x" * 10000
+        journal.Close()
+
+        journal = task_journal.TaskJournal(path)
+        assert journal.connection.execute("SELECT COUNT(*) FROM payloads").fetchone()[0] == 2
+        assert journal.connection.execute("SELECT MAX(LENGTH(task)) FROM tasks").fetchone()[0] < 100
+        replayed = journal.Replay()
+        assert [task.send_photo.caption for task in replayed[:3]] == ["photo"] * 3
+        assert replayed[0].send_photo.data == b"x" * 10000
+        assert replayed[1].send_photo.data is replayed[0].send_photo.data
+        assert replayed[3].send_photos.data == [b"a", b"b"]
+        for task in replayed:
+            journal.Result(task)
+        journal.Close()
+
+        journal = task_journal.TaskJournal(path)
+        assert journal.Replay() == []
+        assert journal.connection.execute("SELECT COUNT(*) FROM payloads").fetchone()[0] == 0
+        journal.Close()
@@ -0,0 +1,57 @@
+import asyncio
+import io
+import pytest
+from unittest import mock
+
+from tg_sender import bots
+from tg_sender import task_stream
+from tg_sender import tg_messages_producer
+from tg_sender import tg_sender_api
+
+FAKE_TOKENS = ["123456:AAAA"]
+
+def MakeTasks():
+    return [
+        tg_sender_api.Task(channel = "@first", send_text = tg_sender_api.SendText(text = "x" * 300)),
+        tg_sender_api.Task(channel = "@second", send_photos = tg_sender_api.SendPhotos(caption = "c", data = [b"1", b"2"])),
+        tg_sender_api.Task(channel = "@third", delete = tg_sender_api.Delete(message_id = 7)),
+    ]
+
+def testEncodeFrame():
+    assert task_stream.EncodeFrame(b"") == b"\x00"
+    assert task_stream.EncodeFrame(b"a" * 300)[:2] == b"\xac\x02"
+
+@pytest.mark.parametrize("decoder", list(task_stream.DECODERS))
+def testReadTasks(decoder):
+    f = io.BytesIO()
+    task_stream.WriteTasks(f, MakeTasks())
+    f.seek(0)
+    # frames and even lengths are cut between chunks
+    tasks = list(task_stream.ReadTasks(f, decoder, chunk_size = 3))
+    assert [task_stream.Serialize(task) for task in tasks] == [bytes(task) for task in MakeTasks()]
+    assert tasks[1].send_photos.data == [b"1", b"2"]
+
+def testTruncatedStream():
+    data = b"".join(task_stream.EncodeFrame(bytes(task)) for task in MakeTasks())
+    with pytest.raises(task_stream.StreamError):
+        list(task_stream.ReadFrames(io.BytesIO(data[:-1])))
+    with pytest.raises(task_stream.StreamError):
+        task_stream.FrameSplitter(max_frame_size = 10).Feed(data)
+
+def testUnknownDecoder():
+    with pytest.raises(ValueError):
+        task_stream.GetDecoder("json")
+
+async def testSubmitStream():
+    reader = asyncio.StreamReader()
+    async with bots.Bots(FAKE_TOKENS) as senders:
+        producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+        submitting = asyncio.create_task(task_stream.SubmitStream(producer, reader, chunk_size = 5))
+        invalid = tg_sender_api.Task(channel = "@first")
+        for task in MakeTasks()[:2] + [invalid]:
+            reader.feed_data(task_stream.EncodeFrame(bytes(task)))
+            await asyncio.sleep(0)
+        reader.feed_eof()
+        assert await submitting == 2
+        assert producer.queue.qsize() == 2
+        producer.on_error.assert_called_once()
@@ -0,0 +1,374 @@
+import asyncio
+import pytest
+import tempfile
+import aiogram
+from unittest import mock
+
+from tg_sender import bots
+from tg_sender import error_classifier
+from tg_sender import file_id_cache
+from tg_sender import preflight
+from tg_sender import rate_backend
+from tg_sender import tg_messages_producer
+from tg_sender import tg_sender_api
+
+FAKE_TOKENS = ["123456:AAAA", "654321:BBBB"]
+
+def MakeTask(channel, text):
+    return tg_sender_api.Task(
+        channel = channel,
+        send_text = tg_sender_api.SendText(text = text)
+    )
+
+class TestMessagesProducer:
+
+    async def testRunSubmit(self):
+        sent = []
+        async def send_message(*args, **kwargs):
+            sent.append((kwargs["chat_id"], kwargs["text"]))
+            return mock.MagicMock(message_id = len(sent))
+
+        with mock.patch.object(aiogram.Bot, 'send_message', side_effect = send_message):
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                on_success = mock.MagicMock()
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(), on_success)
+                runner = asyncio.create_task(producer.run())
+                for i in range(3):
+                    producer.submit(MakeTask("@first", f"first-{i}"))
+                producer.submit(MakeTask("@second", "second-0"))
+                # two bots: two messages per channel right away, the third one after the delay
+                await asyncio.sleep(0.1)
+                assert on_success.call_count == 3
+                await asyncio.sleep(1.1)
+                assert on_success.call_count == 4
+                producer.stop()
+                await runner
+                await producer.wait_for_all_tasks()
+        assert [text for chat, text in sent if chat == "@first"] == ["first-0", "first-1", "first-2"]
+
+    async def testSubmitValidates(self):
+        async with bots.Bots(FAKE_TOKENS) as senders:
+            producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+            with pytest.raises(ValueError):
+                producer.submit(tg_sender_api.Task(channel = "@first"))
+
+    # without a configured cache the broadcast keeps its own file_ids
+    @pytest.mark.parametrize("with_cache", [True, False])
+    async def testBroadcastUploadsOnce(self, with_cache):
+        uploads = []
+        async def send_photo(chat_id, **kwargs):
+            if isinstance(kwargs["photo"], aiogram.types.FSInputFile):
+                uploads.append(chat_id)
+                await asyncio.sleep(0.05)
+            message = mock.MagicMock(message_id = len(chat_id))
+            message.photo[-1].file_id = "file_id"
+            return message
+
+        channels = ["@a", "@bb", "@ccc"]
+        with tempfile.NamedTemporaryFile() as tmp, \
+                mock.patch.object(aiogram.Bot, 'send_photo', side_effect = send_photo):
+            file_ids = file_id_cache.FileIdCache() if with_cache else None
+            async with bots.Bots(FAKE_TOKENS[:1], file_ids = file_ids) as senders:
+                on_success = mock.MagicMock()
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(), on_success)
+                task = tg_sender_api.Task(broadcast = tg_sender_api.Broadcast(
+                    channels = channels,
+                    send_photo = tg_sender_api.SendPhoto(caption = "banner", path = tmp.name)))
+                runner = asyncio.create_task(producer.run())
+                producer.submit(task)
+                await asyncio.sleep(0.2)
+                producer.stop()
+                await runner
+                await producer.wait_for_all_tasks()
+        assert len(uploads) == 1
+        assert on_success.call_count == 3
+        assert task.details.sent
+        assert task.broadcast.results == {channel: len(channel) for channel in channels}
+        assert not producer.broadcast_file_ids
+
+    async def testSubmitPreflight(self):
+        async with bots.Bots(FAKE_TOKENS) as senders:
+            on_error = mock.MagicMock()
+            producer = tg_messages_producer.MessagesProducer(senders, "test", on_error)
+            producer.submit(MakeTask("@first", "x" * 5000))
+            # rejected locally, never queued
+            assert producer.queue.empty()
+            assert on_error.call_count == 1
+
+    async def testPollingPreflightsOnce(self):
+        async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+            producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+            _, delay = senders.GetFreeBot("@busy")
+            delay.UpdateChannelReady("@busy", 10)
+            task = MakeTask("@busy", "*bold*")
+            with mock.patch.object(preflight, "CheckTask", wraps = preflight.CheckTask) as check:
+                for _ in range(3):
+                    assert await producer.TakeBots([task]) == []
+            assert check.call_count == 1
+
+    async def testRetryAndDeadLetter(self):
+        sent = []
+        async def send_message(*args, **kwargs):
+            if kwargs["chat_id"] == "@broken":
+                raise aiogram.exceptions.TelegramServerError(None, "Bad Gateway")
+            sent.append(kwargs["chat_id"])
+            return mock.MagicMock(message_id = len(sent))
+
+        with mock.patch.object(aiogram.Bot, 'send_message', side_effect = send_message):
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                dead = []
+                producer = tg_messages_producer.MessagesProducer(
+                    senders, "test", mock.MagicMock(), on_dead_letter = lambda task, e: dead.append(task),
+                    retry_policy = error_classifier.RetryPolicy(max_attempts = 3, base_delay = 0.05, jitter = 0))
+                runner = asyncio.create_task(producer.run())
+                broken = MakeTask("@broken", "x")
+                producer.submit(broken)
+                producer.submit(MakeTask("@fine", "y"))
+                await asyncio.sleep(0.1)
+                assert sent == ["@fine"]
+                assert broken.details.attempts >= 1 and not dead
+                # 0.05 + 0.1 of backoff, the channel delay is longer: bots alternate, 1 second each
+                await asyncio.sleep(1.2)
+                assert dead == [broken]
+                assert broken.details.attempts == 3
+                producer.stop()
+                await runner
+
+    async def testCoalescePhotos(self):
+        groups = []
+        async def send_media_group(chat_id, **kwargs):
+            media = kwargs["media"]
+            groups.append([item.caption for item in media])
+            messages = [mock.MagicMock(message_id = 100 * len(groups) + i) for i in range(len(media))]
+            for message in messages:
+                message.photo[-1].file_id = "file_id"
+            return messages
+
+        with tempfile.NamedTemporaryFile() as tmp, \
+                mock.patch.object(aiogram.Bot, 'send_media_group', side_effect = send_media_group):
+            async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(), coalesce_photos = True)
+                tasks = [tg_sender_api.Task(channel = "@photos", send_photo = tg_sender_api.SendPhoto(caption = str(i), path = tmp.name))
+                         for i in range(12)]
+                for task in tasks:
+                    producer.submit(task)
+                # a group stops at a photo whose file is still being checked
+                await asyncio.gather(*producer.file_checks.values())
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                # 10 photos per media group, the rest waits for the channel
+                assert groups == [[str(i) for i in range(10)]]
+                assert [task.details.result for task in tasks[:10]] == list(range(100, 110))
+                await asyncio.sleep(1.1)
+                assert groups[1] == ["10", "11"]
+                assert all(task.details.sent for task in tasks)
+                producer.stop()
+                await runner
+
+    async def testCoalesceTexts(self):
+        sent = []
+        async def send_message(*args, **kwargs):
+            sent.append(kwargs["text"])
+            return mock.MagicMock(message_id = len(sent))
+
+        with mock.patch.object(aiogram.Bot, 'send_message', side_effect = send_message):
+            async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(), coalesce_texts = True)
+                tasks = [MakeTask("@chatty", f"line-{i}") for i in range(3)]
+                tasks.append(MakeTask("@chatty", "x" * 4090))
+                for task in tasks:
+                    producer.submit(task)
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                # the long one does not fit into the same message
+                assert sent == ["line-0\nline-1\nline-2"]
+                assert [task.details.result for task in tasks[:3]] == [1, 1, 1]
+                await asyncio.sleep(1.1)
+                assert tasks[3].details.result == 2
+                producer.stop()
+                await runner
+
+    async def testSharedRateBackend(self):
+        sent = []
+        async def send_message(*args, **kwargs):
+            sent.append(kwargs["text"])
+            return mock.MagicMock(message_id = len(sent))
+
+        # two senders of the same token, as in two processes
+        backend = rate_backend.MemoryBackend()
+        with mock.patch.object(aiogram.Bot, 'send_message', side_effect = send_message):
+            async with bots.Bots(FAKE_TOKENS[:1], rate_backend = backend) as first, \
+                       bots.Bots(FAKE_TOKENS[:1], rate_backend = backend) as second:
+                producers = [tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+                             for senders in (first, second)]
+                for i, producer in enumerate(producers):
+                    producer.submit(MakeTask("@shared", f"node-{i}"))
+                runners = [asyncio.create_task(producer.run()) for producer in producers]
+                await asyncio.sleep(0.1)
+                # one message per second in the channel between both of them
+                assert len(sent) == 1
+                await asyncio.sleep(1.1)
+                assert sorted(sent) == ["node-0", "node-1"]
+                for producer in producers:
+                    producer.stop()
+                await asyncio.gather(*runners)
+
+    async def testNoGroupingWhileRateLimited(self):
+        async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+            producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(), coalesce_texts = True)
+            _, delay = senders.GetFreeBot("@busy")
+            delay.UpdateChannelReady("@busy", 10)
+            for i in range(3):
+                producer.submit(MakeTask("@busy", f"line-{i}"))
+                producer._add_pending(producer.queue.get_nowait())
+            with mock.patch.object(preflight, "GetVisibleText", wraps = preflight.GetVisibleText) as render:
+                assert 9 < await producer._dispatch_pending() <= 10
+            assert render.call_count == 0
+
+    async def testPassVisitsDueChannels(self):
+        async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+            producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+            for i in range(3):
+                channel = f"@busy-{i}"
+                _, delay = senders.GetFreeBot(channel)
+                delay.UpdateChannelReady(channel, 10 + i)
+                producer._add_pending(MakeTask(channel, "x"))
+            with mock.patch.object(senders, "GetSecondsUntilReady", wraps = senders.GetSecondsUntilReady) as seconds:
+                assert 9 < await producer._dispatch_pending() <= 10
+                assert seconds.call_count == 3
+                # nothing is due yet and nothing new came
+                assert 9 < await producer._dispatch_pending() <= 10
+                assert seconds.call_count == 3
+                producer._add_pending(MakeTask("@busy-2", "y"))
+                assert 9 < await producer._dispatch_pending() <= 10
+                assert seconds.call_count == 4
+
+    async def testBulkDelete(self):
+        calls = []
+        async def delete_messages(*args, **kwargs):
+            calls.append(kwargs["message_ids"])
+            return True
+
+        with mock.patch.object(aiogram.Bot, 'delete_messages', side_effect = delete_messages):
+            async with bots.Bots(FAKE_TOKENS[:1]) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+                tasks = [tg_sender_api.Task(channel = "@cleanup", delete = tg_sender_api.Delete(message_id = i))
+                         for i in range(1, 151)]
+                for task in tasks:
+                    producer.submit(task)
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                assert calls == [list(range(1, 101))]
+                await asyncio.sleep(1.1)
+                assert calls[1] == list(range(101, 151))
+                assert all(task.details.sent and task.details.result == 1 for task in tasks)
+                producer.stop()
+                await runner
+
+    async def testFailedGroupKeepsOrder(self):
+        calls = []
+        async def delete_messages(*args, **kwargs):
+            calls.append(kwargs["message_ids"])
+            if len(calls) == 1:
+                raise aiogram.exceptions.TelegramServerError(None, "Bad Gateway")
+            return True
+
+        with mock.patch.object(aiogram.Bot, 'delete_messages', side_effect = delete_messages):
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                producer = tg_messages_producer.MessagesProducer(
+                    senders, "test", mock.MagicMock(),
+                    retry_policy = error_classifier.RetryPolicy(base_delay = 0.05, jitter = 0))
+                tasks = [tg_sender_api.Task(channel = "@cleanup", delete = tg_sender_api.Delete(message_id = i))
+                         for i in [1, 2, 3]]
+                for task in tasks:
+                    producer.submit(task)
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.3)
+                # the whole group is retried by the second bot, in the order it was submitted
+                assert calls == [[1, 2, 3], [1, 2, 3]]
+                assert all(task.details.sent for task in tasks)
+                producer.stop()
+                await runner
+
+    async def testBulkForward(self):
+        calls = []
+        async def forward_messages(*args, **kwargs):
+            calls.append(kwargs["message_ids"])
+            # the first batch has a message that can't be forwarded
+            ids = kwargs["message_ids"][1:] if len(calls) == 1 else kwargs["message_ids"]
+            return [mock.MagicMock(message_id = 1000 + i) for i in ids]
+
+        with mock.patch.object(aiogram.Bot, 'forward_messages', side_effect = forward_messages):
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+                first = [tg_sender_api.Task(channel = "@mirror", forward = tg_sender_api.Forward(from_channel = "@a", message_id = i))
+                         for i in [1, 2, 3]]
+                second = [tg_sender_api.Task(channel = "@mirror", forward = tg_sender_api.Forward(from_channel = "@b", message_id = i))
+                          for i in [4, 5]]
+                for task in first + second:
+                    producer.submit(task)
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                # two bots: one call per source chat
+                assert calls == [[1, 2, 3], [4, 5]]
+                assert all(task.details.sent for task in first + second)
+                assert [task.details.result for task in first] == [0, 0, 0]
+                assert [task.details.result for task in second] == [1004, 1005]
+                producer.stop()
+                await runner
+
+    async def testForwardKeepsOrder(self):
+        forwarded = []
+        async def forward_message(*args, **kwargs):
+            forwarded.append(kwargs["message_id"])
+            return mock.MagicMock(message_id = 1000 + kwargs["message_id"])
+
+        with mock.patch.object(aiogram.Bot, 'forward_message', side_effect = forward_message), \
+                mock.patch.object(aiogram.Bot, 'forward_messages') as forward_messages:
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+                for i in [5, 3]:
+                    producer.submit(tg_sender_api.Task(channel = "@mirror",
+                                                       forward = tg_sender_api.Forward(from_channel = "@a", message_id = i)))
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                # forwardMessages would post them sorted
+                assert forwarded == [5, 3]
+                assert forward_messages.call_count == 0
+                producer.stop()
+                await runner
+
+    async def testCopy(self):
+        with mock.patch.object(aiogram.Bot, 'copy_message', return_value = mock.MagicMock(message_id = 7)) as copy_message:
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock())
+                task = tg_sender_api.Task(channel = "@mirror",
+                                          copy = tg_sender_api.Copy(from_channel = "@a", message_id = 1, remove_caption = True))
+                producer.submit(task)
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                assert task.details.result == 7
+                assert copy_message.call_args.kwargs["caption"] == ""
+                producer.stop()
+                await runner
+
+    async def testMissingFileFailsBeforeDispatch(self, caplog):
+        with mock.patch.object(aiogram.Bot, 'send_photo') as send_photo:
+            async with bots.Bots(FAKE_TOKENS) as senders:
+                dead = []
+                producer = tg_messages_producer.MessagesProducer(senders, "test", mock.MagicMock(),
+                                                                 on_dead_letter = lambda task, e: dead.append(e))
+                task = tg_sender_api.Task(channel = "@photos", send_photo = tg_sender_api.SendPhoto(path = "/nonexistent.png"))
+                producer.submit(task)
+                assert id(task) in producer.file_checks
+                runner = asyncio.create_task(producer.run())
+                await asyncio.sleep(0.1)
+                assert task.details.sent and isinstance(dead[0], FileNotFoundError)
+                # no rate-limit slot spent
+                assert send_photo.call_count == 0
+                assert senders.GetSecondsUntilReady("@photos") == 0
+                assert not producer.file_checks
+                # the traceback of the failed check is logged, not the empty current one
+                assert "NoneType: None" not in caplog.text and "FileNotFoundError" in caplog.text
+                producer.stop()
+                await runner
@@ -1,8 +1,9 @@
 import asyncio
 import aiogram
 from aiogram import exceptions
-import re
-import traceback
+import heapq
+import time
+import weakref
 import betterproto
 
 from tg_sender import bots
@@ -10,119 +11,541 @@ from tg_sender import bot
 from tg_sender import channel_delay
 from tg_sender import tg_sender_api
 from tg_sender import base_message_data
+from tg_sender import base_message_to_send
+from tg_sender import task_journal
+from tg_sender import file_id_cache
+from tg_sender import preflight
+from tg_sender import error_classifier
 from logger import logging
 
+def GetTaskPaths(task: tg_sender_api.Task) -> list[str]:
+    """Media files of the task that are read from disk."""
+    task_name = betterproto.which_one_of(task, "task")[0]
+    if task_name in ("send_photo", "send_file"):
+        payload = getattr(task, task_name)
+        return [payload.path] if payload.path and not payload.data else []
+    if task_name == "send_photos":
+        return list(task.send_photos.paths)
+    return []
+
+# between texts coalesced into one message
+TEXT_SEPARATOR = "\n"
+
 class MessagesProducer:
-    def __init__(self, senders: bots.Bots, module_folder_name: str, on_error, on_success = None):
+    def __init__(self, senders: bots.Bots, module_folder_name: str, on_error, on_success = None,
+                 journal: task_journal.TaskJournal = None, on_dead_letter = None,
+                 retry_policy: error_classifier.RetryPolicy = None, coalesce_photos: bool = False,
+                 coalesce_texts: bool = False):
         if not isinstance(senders, bots.Bots):
             raise ValueError("you did not pass senders, arent you?")
         self.senders = senders
         self.on_error = on_error
         self.on_success = on_success
         self.module_folder_name = module_folder_name
-        self.active_tasks = set()       
+        # on_dead_letter(task, error) gets every task that was given up on
+        self.on_dead_letter = on_dead_letter
+        self.retry_policy = retry_policy or error_classifier.RetryPolicy()
+        # run() sends consecutive send_photo tasks of a channel as one media group
+        self.coalesce_photos = coalesce_photos
+        # run() joins short send_text tasks piled up while their channel was busy into one message
+        self.coalesce_texts = coalesce_texts
+        self.active_tasks = set()
+        # event-driven mode: submit() feeds the queue, run() dispatches
+        self.queue = asyncio.Queue()
+        self.message_list = base_message_to_send.BaseMessageList()
+        self.running = False
+        # id(child task) -> broadcast task, id(broadcast task) -> children left
+        self.broadcast_children: dict[int, tg_sender_api.Task] = {}
+        self.broadcast_remaining: dict[int, int] = {}
+        # broadcast id -> file_ids of its uploads when Bots has no file_id cache
+        self.broadcast_file_ids: dict[int, file_id_cache.FileIdCache] = {}
+        # id(task) -> task, polling tasks that went through Preflight already
+        self.preflighted: weakref.WeakValueDictionary[int, tg_sender_api.Task] = weakref.WeakValueDictionary()
+        # id(task) -> check of its media files started by submit(), the task waits for it at the head of its channel
+        self.file_checks: dict[int, asyncio.Future] = {}
+        # channels run() visits in the next pass: those with new or returned tasks, and those that are due
+        self.due_channels: dict[str, None] = {}
+        # min-heap of (monotonic time, channel) when a channel can go on, entries not in `deadlines` are stale
+        self.wakeups: list[tuple[float, str]] = []
+        self.deadlines: dict[str, float] = {}
+        # optional durability for run()/submit(): unfinished tasks of the previous process are resumed
+        self.journal = journal
+        if self.journal is not None:
+            for task in self.journal.Replay():
+                self._add_pending(task)
 
     def ErrorHandler(self, e, task: tg_sender_api.Task):
-        logging.info(f"got error: {str(e)}, task: {task}")
-        logging.info(traceback.format_exc())
-        self.on_error(self.module_folder_name, f"{str(e)}\n{task}")
+        description = base_message_to_send.DescribeTask(task)
+        # exc_info = e: _fail_before_dispatch calls this outside of an except block
+        logging.info(f"got error: {str(e)}, task: {description}", exc_info = e)
+        self.on_error(self.module_folder_name, f"{str(e)}\n{description}")
 
-    async def WrapWholeCall(self, task_fn, task: tg_sender_api.Task, channel: str, channel_delay: channel_delay.ChannelDelay):
+    async def WrapWholeCall(self, task_fn, task, channel: str, channel_delay: channel_delay.ChannelDelay,
+                            free_bot: bot.SenderBot = None):
+        """`task` is a Task or the list of tasks coalesced into this call."""
+        tasks = task if isinstance(task, list) else [task]
         try:
             await task_fn
         except exceptions.TelegramRetryAfter as ra:
-            m = re.search(r'.*\s(\d+) seconds.', str(ra))
-            if m:
-                found = m.group(1)
-                channel_delay.UpdateChannelReady(channel, int(found))
-            self.ErrorHandler(ra, task)
+            # a flood wait may be global for the token, so the whole bot waits, not only this channel
+            channel_delay.UpdateChannelReady(channel, ra.retry_after)
+            if free_bot is not None:
+                free_bot.rate_limiter.OnFloodWait(ra.retry_after)
+            for task in tasks:
+                self.OnTaskError(ra, task)
+                self.ErrorHandler(ra, task)
         except Exception as e:
-            self.ErrorHandler(e, task)
+            for task in tasks:
+                self.OnTaskError(e, task)
+                self.ErrorHandler(e, task)
+            # a group backs off as a whole, so it can be sent in one call again
+            retry_at = max(task.details.retry_at for task in tasks)
+            for task in tasks:
+                task.details.retry_at = retry_at
+        else:
+            if free_bot is not None:
+                free_bot.rate_limiter.OnSuccess()
         finally:
-            task.details.in_process = 0
-            
+            for task in tasks:
+                task.details.in_process = 0
+                if task.details.sent:
+                    self.OnBroadcastChildDone(task)
+
     async def WrapTGCall(self, message_future, task: tg_sender_api.Task):
-        try:
-            result = await message_future
-            logging.info("marking message as sent, result: %s", result)
-            task.details.sent = 1
-            if result is not None:
-                if isinstance(result, bool): # for pin and unpin
-                    pass # already assigned
-                elif isinstance(result, list):
-                    result = result[0].message_id
-                else:
-                    result = result.message_id
-                task.details.result = result
-                if self.on_success:
-                    self.on_success(task, result)
-        except FileNotFoundError as fnfe:
-            logging.error("file not found: %s", fnfe)
-            task.details.sent = 1
-            raise fnfe
-        except exceptions.TelegramMigrateToChat as tmtc:
-            logging.error("got TelegramMigrateToChat: %s", tmtc)
-            task.details.sent = 1
-            raise tmtc
-        except exceptions.TelegramForbiddenError as tfe:
+        # errors are sorted out by OnTaskError in WrapWholeCall
+        result = await message_future
+        logging.info("marking message as sent, result: %s", result)
+        task.details.sent = 1
+        if result is not None:
+            if isinstance(result, bool): # for pin and unpin
+                pass # already assigned
+            elif isinstance(result, list):
+                result = result[0].message_id
+            else:
+                result = result.message_id
+            task.details.result = result
+            if self.on_success:
+                self.on_success(task, result)
+
+    def OnTaskError(self, e: Exception, task: tg_sender_api.Task):
+        """Decides by error_classifier.RULES whether the task is retried, fixed and retried or given up."""
+        rule = error_classifier.Classify(e)
+        if rule.counts_attempt:
+            task.details.attempts += 1
+        if rule.outcome == error_classifier.PERMANENT or task.details.attempts >= self.retry_policy.max_attempts:
+            logging.error("giving up after %d attempts (%s): %s", task.details.attempts, rule.outcome, e)
             task.details.sent = 1
-            logging.error("got Forbidden: %s", str(tfe))
-            raise tfe
-        except exceptions.TelegramBadRequest as br:
-            logging.error("got BadRequest: %s", br)
-            if "Replied message not found" in str(br):
-                task.options.reply_to = None
-            elif "too long" in str(br):
-                logging.error("got MessageIsTooLong: %s", br)
+            if self.on_dead_letter:
+                self.on_dead_letter(task, e)
+        elif rule.outcome == error_classifier.FIX_THEN_RETRY:
+            logging.error("retrying with a fix (%s): %s", rule.fix.__name__, e)
+            rule.fix(task)
+        else:
+            delay = self.retry_policy.GetDelay(max(task.details.attempts, 1))
+            logging.error("retrying in %.1f seconds: %s", delay, e)
+            task.details.retry_at = time.monotonic() + delay
+
+    def IsBackingOff(self, task: tg_sender_api.Task, now: float) -> bool:
+        return task.details.retry_at > now
+
+    def Preflight(self, task: tg_sender_api.Task) -> bool:
+        """Local checks before a rate-limit slot is spent, False if the task can't be sent as is."""
+        try:
+            preflight.CheckTask(task, self.senders.render_cache.Render)
+            return True
+        except preflight.PreflightError as pe:
+            logging.error("preflight failed: %s", pe)
+            if pe.permanent:
                 task.details.sent = 1
-            elif "can't parse entities" in str(br):
-                logging.error("got can't parse entities: %s", br)
+                if self.on_dead_letter:
+                    self.on_dead_letter(task, pe)
+            else: # the same as on "can't parse entities" from telegram
                 task.options.parse_mode = None
-            elif "chat not found" in str(br):
-                logging.error(f"chat not found: {task.channel}:{task.thread_id}")
-                task.details.sent = 1
-            elif "message to delete not found" in str(br):
-                logging.error(f"message to delete not found {str(br)}")
-                task.details.sent = 1
-            elif "TOPIC_CLOSED" in str(br):
-                logging.error(f"TOPIC_CLOSED: {task.channel}:{task.thread_id}")
-                task.details.sent = 1
-            elif "message can't be deleted" in str(br):
-                logging.error(f"message can't be deleted: {task.channel}:{task.thread_id}")
-                task.details.sent = 1
-            elif "message thread not found" in str(br):
-                logging.error(f"message thread not found: {task.channel}:{task.thread_id}")
-                task.thread_id = None
-            raise br
-        except exceptions.AiogramError as ae:  
-            logging.error("got an unknown exception: %s", str(ae))
-            task.details.sent = 1
-            raise ae
+            self.ErrorHandler(pe, task)
+            return False
 
-    async def ProduceMessages(self, tasks: list[tg_sender_api.Task]):
-        pooled_tasks = []
-        for task in tasks:            
-            channel = task.channel
-            free_bot, channel_delay = self.senders.GetFreeBot(channel)
-            if free_bot is not None:
-                task.details.in_process = 1
-                channel_delay.UpdateChannelReady(channel)
+    def TakeBot(self, task, get_group = None):
+        """Takes a bot and the rate-limit slots for the task, or for the list of tasks sent in one call.
+
+        get_group() is asked for such a list only once a bot is free, None sends the task alone.
+        Returns (tasks, start, reservation): start() makes the sending coroutine once Bots.ReserveMany
+        has confirmed the reservation. None if no bot is free.
+        """
+        channel = (task[0] if isinstance(task, list) else task).channel
+        free_bot, channel_delay = self.senders.GetFreeBot(channel)
+        if free_bot is None:
+            return None
+        if get_group is not None:
+            task = get_group() or task
+        tasks = task if isinstance(task, list) else [task]
+        for queued in tasks:
+            queued.details.in_process = 1
+        policy = self.senders.rate_policies.Get(channel, tasks[0].chat_type)
+        channel_delay.UpdateChannelReady(channel, policy = policy)
+        free_bot.rate_limiter.Consume()
+
+        def start():
+            if isinstance(task, list):
+                task_fn = self.SendGroup(tasks, free_bot)
+            else:
                 task_fn = self.GetTaskFN(task, free_bot)
-                wrapped_task_fn = self.WrapWholeCall(task_fn, task, channel, channel_delay)
-                pooled_tasks.append(wrapped_task_fn)
-        await asyncio.gather(*pooled_tasks)
+            return self.WrapWholeCall(task_fn, task, channel, channel_delay, free_bot)
+        return tasks, start, (free_bot, channel_delay, channel, policy)
+
+    async def ReserveTaken(self, taken: list) -> list[bool]:
+        """Confirms (tasks, start, reservation) from TakeBot with the shared rate backend in one batch.
+
+        Denied tasks are not in process anymore and wait for the next pass.
+        """
+        allowed = await self.senders.ReserveMany([reservation for _, _, reservation in taken])
+        for (tasks, _, _), ok in zip(taken, allowed):
+            if not ok:
+                for task in tasks:
+                    task.details.in_process = 0
+        return allowed
+
+    async def StartTask(self, task):
+        """Takes a bot for the task, or for the list of tasks sent in one call.
+
+        Returns the sending coroutine, None if no bot is free.
+        """
+        taken = self.TakeBot(task)
+        if taken is None:
+            return None
+        if not (await self.ReserveTaken([taken]))[0]:
+            return None
+        return taken[1]()
+
+    def GetGroup(self, queue, now: float):
+        """Leading tasks of a channel queue to be sent in one call, None if the head goes alone."""
+        task_name = self.GetTaskName(queue[0])
+        if task_name == "send_photo" and self.coalesce_photos:
+            return self.GetPhotoGroup(queue, now)
+        if task_name == "send_text" and self.coalesce_texts:
+            return self.GetTextGroup(queue, now)
+        if task_name == "delete":
+            return self.GetDeleteGroup(queue, now)
+        if task_name in ("forward", "copy"):
+            return self.GetForwardGroup(queue, now)
+        return None
+
+    def GetForwardGroup(self, queue, now: float):
+        """Leading forward (or copy) tasks of a channel queue from the same chat, up to one forwardMessages call.
+
+        Message ids have to increase: telegram posts them sorted, the tasks are posted in their order.
+        """
+        head = queue[0]
+        task_name = self.GetTaskName(head)
+        head_impl = getattr(head, task_name)
+        group = []
+        for task in queue:
+            if (len(group) == preflight.MESSAGE_IDS_MAX or self.GetTaskName(task) != task_name
+                    or task.thread_id != head.thread_id or self.IsBackingOff(task, now)):
+                break
+            task_impl = getattr(task, task_name)
+            if (task_impl.from_channel != head_impl.from_channel
+                    or (group and task_impl.message_id <= getattr(group[-1], task_name).message_id)
+                    or (task_name == "copy" and task_impl.remove_caption != head_impl.remove_caption)):
+                break
+            group.append(task)
+        return group if len(group) > 1 else None
+
+    def GetDeleteGroup(self, queue, now: float):
+        """Leading delete tasks of a channel queue, up to one deleteMessages call."""
+        group = []
+        for task in queue:
+            if len(group) == preflight.MESSAGE_IDS_MAX or self.GetTaskName(task) != "delete" or self.IsBackingOff(task, now):
+                break
+            group.append(task)
+        return group if len(group) > 1 else None
+
+    def GetTextGroup(self, queue, now: float):
+        """Leading send_text tasks of a channel queue that fit in one message, None if there are less than 2."""
+        head = queue[0]
+        if head.options.reply_to:
+            return None
+        options = bytes(head.options)
+        render = self.senders.render_cache.Render
+        group = []
+        length = 0
+        for task in queue:
+            if (self.GetTaskName(task) != "send_text" or task.thread_id != head.thread_id
+                    or bytes(task.options) != options or self.IsBackingOff(task, now)):
+                break
+            visible, balanced = preflight.GetVisibleText(task.send_text.text, task.options.parse_mode, render)
+            length += preflight.Utf16Len(visible) + (len(TEXT_SEPARATOR) if group else 0)
+            if not balanced or length > preflight.TEXT_LIMIT:
+                break
+            group.append(task)
+        return group if len(group) > 1 else None
+
+    def GetPhotoGroup(self, queue, now: float):
+        """Leading send_photo tasks of a channel queue that fit in one media group, None if there are less than 2."""
+        head = queue[0]
+        if self.GetTaskName(head) != "send_photo":
+            return None
+        options = bytes(head.options)
+        group = []
+        for task in queue:
+            if (len(group) == preflight.MEDIA_GROUP_MAX or self.GetTaskName(task) != "send_photo"
+                    or task.thread_id != head.thread_id or bytes(task.options) != options
+                    or self.IsBackingOff(task, now)
+                    # a missing file would fail the whole group, let it fail alone
+                    or not self.IsFileCheckPassed(task)):
+                break
+            group.append(task)
+        return group if len(group) > 1 else None
+
+    async def TakeBots(self, tasks: list[tg_sender_api.Task]):
+        """Polling API: coroutines for the tasks that can be sent now."""
+        taken = []
+        now = time.monotonic()
+        for task in tasks:
+            if self.IsBackingOff(task, now):
+                continue
+            # once per task as in submit(): a fixable task goes on with the fix, a hopeless one is sent = 1
+            if self.preflighted.get(id(task)) is not task:
+                self.preflighted[id(task)] = task
+                if not self.Preflight(task) and task.details.sent:
+                    continue
+            taken_one = self.TakeBot(task)
+            if taken_one is not None:
+                taken.append(taken_one)
+        allowed = await self.ReserveTaken(taken)
+        return [start() for (_, start, _), ok in zip(taken, allowed) if ok]
+
+    async def ProduceMessages(self, tasks: list[tg_sender_api.Task]):
+        await asyncio.gather(*await self.TakeBots(tasks))
         return []
     
     async def produce_messages(self, tasks: list[tg_sender_api.Task]):
-        for task in tasks:
-            channel = task.channel
-            free_bot, channel_delay = self.senders.GetFreeBot(channel)
-            if free_bot is not None:
-                task.details.in_process = 1
-                channel_delay.UpdateChannelReady(channel)
-                task_fn = self.GetTaskFN(task, free_bot)
-                wrapped_task_fn = self.WrapWholeCall(task_fn, task, channel, channel_delay)
-                self._track_task(asyncio.create_task(wrapped_task_fn))  # Добавляем задачу
+        for wrapped_task_fn in await self.TakeBots(tasks):
+            self._track_task(asyncio.create_task(wrapped_task_fn))  # Добавляем задачу
+
+    def ExpandBroadcast(self, task: tg_sender_api.Task) -> list[tg_sender_api.Task]:
+        """Splits a broadcast into one task per channel, all of them share the payload.
+
+        Per-channel results go to on_success/on_error as usual and into task.broadcast.results,
+        task.details.sent is set once every channel is done.
+        """
+        payload_name, payload = betterproto.which_one_of(task.broadcast, "payload")
+        children = []
+        for channel in task.broadcast.channels:
+            child = tg_sender_api.Task(
+                # own copy: error handling may change options of a single channel
+                options = tg_sender_api.MessageOptions().parse(bytes(task.options)),
+                channel = channel,
+                thread_id = task.thread_id,
+                custom_int_field = task.custom_int_field,
+                custom_string_field = task.custom_string_field,
+                chat_type = task.chat_type,
+            )
+            setattr(child, payload_name, payload)
+            self.broadcast_children[id(child)] = task
+            children.append(child)
+        self.broadcast_remaining[id(task)] = len(children)
+        if payload_name in ("send_photo", "send_photos", "send_file") and self.senders.file_ids is None:
+            # each bot uploads the file once for the whole broadcast anyway
+            self.broadcast_file_ids[id(task)] = file_id_cache.FileIdCache()
+        return children
+
+    def GetBroadcastFileIds(self, task: tg_sender_api.Task):
+        """file_id cache of the broadcast the task belongs to, None to use the bots' own."""
+        broadcast_task = self.broadcast_children.get(id(task))
+        return None if broadcast_task is None else self.broadcast_file_ids.get(id(broadcast_task))
+
+    def OnBroadcastChildDone(self, task: tg_sender_api.Task):
+        broadcast_task = self.broadcast_children.pop(id(task), None)
+        if broadcast_task is None:
+            return
+        broadcast_task.broadcast.results[task.channel] = task.details.result
+        self.broadcast_remaining[id(broadcast_task)] -= 1
+        if self.broadcast_remaining[id(broadcast_task)] == 0:
+            del self.broadcast_remaining[id(broadcast_task)]
+            self.broadcast_file_ids.pop(id(broadcast_task), None)
+            broadcast_task.details.sent = 1
+            logging.info("broadcast done: %s", broadcast_task.broadcast.results)
+
+    def submit(self, task: tg_sender_api.Task):
+        """Ставит задачу в очередь, run() отправит её как только освободится бот."""
+        base_message_to_send.BaseMessageList.ValidateTask(task)
+        if self.GetTaskName(task) == "broadcast":
+            for child in self.ExpandBroadcast(task):
+                self.submit(child)
+            return
+        # a fixable task goes on with the fix, a hopeless one is dropped
+        if not self.Preflight(task) and task.details.sent:
+            self.OnBroadcastChildDone(task)
+            return
+        self.StartFileCheck(task)
+        if self.journal is not None:
+            self.journal.Enqueue(task)
+        self.queue.put_nowait(task)
+
+    def StartFileCheck(self, task: tg_sender_api.Task):
+        """Checks media paths of the task in the file_io pool while it waits in the queue."""
+        paths = GetTaskPaths(task)
+        if not paths:
+            return
+        try:
+            check = asyncio.ensure_future(self.senders.file_io.StatAll(paths))
+        except RuntimeError: # no event loop, the files are checked when sent
+            return
+        self.file_checks[id(task)] = check
+        check.add_done_callback(lambda _, channel = task.channel: self._wake(channel))
+
+    def IsFileCheckPassed(self, task: tg_sender_api.Task) -> bool:
+        check = self.file_checks.get(id(task))
+        return check is None or (check.done() and check.exception() is None)
+
+    def stop(self):
+        self.running = False
+        self.queue.put_nowait(None)
+
+    async def run(self):
+        """Sleeps until new work arrives or the earliest channel becomes ready."""
+        self.running = True
+        timeout = await self._dispatch_pending() # resumed from the journal
+        try:
+            while self.running:
+                if self.journal is not None:
+                    flush_in = self.journal.GetSecondsUntilFlush()
+                    if flush_in is not None and (timeout is None or flush_in < timeout):
+                        timeout = max(flush_in, 0.001)
+                try:
+                    task = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    task = None
+                self._add_pending(task)
+                while not self.queue.empty():
+                    self._add_pending(self.queue.get_nowait())
+                timeout = await self._dispatch_pending()
+                if self.journal is not None:
+                    self.journal.FlushIfDue()
+        finally:
+            if self.journal is not None:
+                await asyncio.wrap_future(self.journal.FlushInBackground())
+
+    def _add_pending(self, task):
+        if task is None: # wake up or stop
+            return
+        self.message_list.Enqueue(task)
+        self.due_channels[task.channel] = None
+
+    def _wake(self, channel: str):
+        """The channel is visited by the next pass of run()."""
+        self.due_channels[channel] = None
+        self.queue.put_nowait(None)
+
+    def _take_due_channels(self, now: float):
+        while self.wakeups and self.wakeups[0][0] <= now:
+            deadline, channel = heapq.heappop(self.wakeups)
+            if self.deadlines.get(channel) == deadline:
+                del self.deadlines[channel]
+                self.due_channels[channel] = None
+        channels, self.due_channels = self.due_channels, {}
+        return channels
+
+    async def _dispatch_pending(self):
+        """Starts everything that can be sent now, returns seconds until the next ready channel.
+
+        Only the channels that are due are visited, a rate-limited channel costs nothing until then.
+        """
+        now = time.monotonic()
+        taken = []
+        # channel -> seconds until it can go on, None to ask Bots; channels waiting for file checks are not here
+        waits: dict[str, float] = {}
+        for channel in self._take_due_channels(now):
+            queue = self.message_list.pending.get(channel)
+            if not queue:
+                continue
+            seconds = None
+            checking_files = False
+            while queue:
+                task = queue[0]
+                if self.IsBackingOff(task, now):
+                    # the channel keeps its order, other channels go on
+                    seconds = task.details.retry_at - now
+                    break
+                check = self.file_checks.get(id(task))
+                if check is not None and not check.done():
+                    checking_files = True # the check wakes run() up when done
+                    break
+                if check is not None and check.exception() is not None:
+                    self._fail_before_dispatch(task, check.exception())
+                    continue
+                # the group is built only when a bot is free, a rate-limited channel costs nothing
+                taken_one = self.TakeBot(task, lambda: self.GetGroup(queue, now))
+                if taken_one is None:
+                    break
+                for started in taken_one[0]:
+                    self.message_list.Start(started)
+                taken.append(taken_one)
+            if not checking_files:
+                waits[channel] = seconds
+
+        # one round trip to a shared rate backend for the whole pass, sends in flight go on meanwhile
+        allowed = await self.ReserveTaken(taken)
+        denied = []
+        denied_channels = set()
+        for (started, start, _), ok in zip(taken, allowed):
+            channel = started[0].channel
+            if not ok or channel in denied_channels:
+                # later tasks of a denied channel go back too, the order is kept
+                denied_channels.add(channel)
+                denied.append(started)
+                continue
+            if self.journal is not None:
+                for task in started:
+                    self.journal.Dispatch(task)
+            async_task = asyncio.create_task(start())
+            async_task.add_done_callback(lambda _, started = started: self._on_group_done(started))
+            self._track_task(async_task)
+        for started in reversed(denied):
+            for task in reversed(started):
+                task.details.in_process = 0
+                self.message_list.Finish(task)
+        for channel in denied_channels:
+            waits[channel] = None
+
+        for channel, seconds in waits.items():
+            if channel not in self.message_list.pending:
+                continue
+            if seconds is None:
+                seconds = self.senders.GetSecondsUntilReady(channel)
+            deadline = now + seconds
+            self.deadlines[channel] = deadline
+            heapq.heappush(self.wakeups, (deadline, channel))
+        # stale entries of the top would wake run() up for nothing
+        while self.wakeups and self.deadlines.get(self.wakeups[0][1]) != self.wakeups[0][0]:
+            heapq.heappop(self.wakeups)
+        if not self.wakeups:
+            return None
+        return max(self.wakeups[0][0] - time.monotonic(), 0.001)
+
+    def _fail_before_dispatch(self, task: tg_sender_api.Task, e: Exception):
+        self.message_list.Start(task)
+        self.OnTaskError(e, task)
+        self.ErrorHandler(e, task)
+        if task.details.sent:
+            self.OnBroadcastChildDone(task)
+        self._on_task_done(task)
+
+    def _on_group_done(self, tasks: list[tg_sender_api.Task]):
+        # retried tasks go back to the head one by one, the last first keeps their order
+        for task in reversed(tasks):
+            self._on_task_done(task)
+
+    def _on_task_done(self, task: tg_sender_api.Task):
+        self.file_checks.pop(id(task), None)
+        # not sent means retry, the list keeps it at the head so channel order is preserved
+        self.message_list.Finish(task)
+        if not task.details.sent:
+            self._wake(task.channel)
+        elif self.journal is not None:
+            self.journal.Result(task)
+            if not self.running: # run() does not flush anymore
+                self.journal.FlushInBackground()
 
     def _track_task(self, task):
         """Добавляет задачу в список активных и удаляет после завершения."""
@@ -149,6 +572,8 @@ class MessagesProducer:
             task_fn = self.SendFile(task, free_bot)
         elif task_name == "forward":
             task_fn = self.Forward(task, free_bot)
+        elif task_name == "copy":
+            task_fn = self.Copy(task, free_bot)
         elif task_name == "pin":
             task_fn = self.Pin(task, free_bot)
         elif task_name == "unpin":
@@ -157,6 +582,8 @@ class MessagesProducer:
             task_fn = self.Delete(task, free_bot)
         elif task_name == "send_markup":
             task_fn = self.send_markup(task, free_bot)
+        elif task_name == "broadcast":
+            raise RuntimeError("broadcast has to be expanded first, see ExpandBroadcast")
         else:
             raise RuntimeError("unknown task: {}".format(task_name if task_name != "" else "empty"))
         return task_fn
@@ -171,6 +598,76 @@ class MessagesProducer:
         message_future = free_bot.SendText(bmd)
         return await self.WrapTGCall(message_future, task)
 
+    def MarkSent(self, task: tg_sender_api.Task, result: int):
+        """Success of a task that was sent as a part of a group call."""
+        task.details.sent = 1
+        task.details.result = result
+        if self.on_success:
+            self.on_success(task, result)
+
+    async def SendGroup(self, tasks: list[tg_sender_api.Task], free_bot: bot.SenderBot):
+        task_name = self.GetTaskName(tasks[0])
+        if task_name == "send_text":
+            return await self.SendTextGroup(tasks, free_bot)
+        if task_name == "delete":
+            return await self.DeleteGroup(tasks, free_bot)
+        if task_name in ("forward", "copy"):
+            return await self.ForwardGroup(tasks, free_bot)
+        return await self.SendPhotoGroup(tasks, free_bot)
+
+    async def ForwardGroup(self, tasks: list[tg_sender_api.Task], free_bot: bot.SenderBot):
+        """Forwards or copies messages of one source chat in one call, every task gets its own message id."""
+        task_name = self.GetTaskName(tasks[0])
+        head = tasks[0]
+        head_impl = getattr(head, task_name)
+        # GetForwardGroup keeps the ids increasing, telegram returns the new ids in the same order
+        message_ids = [getattr(task, task_name).message_id for task in tasks]
+        if task_name == "forward":
+            messages = await free_bot.ForwardMany(head.channel, head_impl.from_channel, message_ids, head.thread_id)
+        else:
+            messages = await free_bot.CopyMany(head.channel, head_impl.from_channel, message_ids, head.thread_id,
+                                               head_impl.remove_caption)
+        if len(messages) != len(tasks):
+            # skipped messages are not reported, so which new id belongs to which task is unknown
+            logging.error("%d of %d messages were forwarded, results are unknown", len(messages), len(tasks))
+            messages = [None] * len(tasks)
+        for task, message in zip(tasks, messages):
+            self.MarkSent(task, message.message_id if message is not None else 0)
+
+    async def DeleteGroup(self, tasks: list[tg_sender_api.Task], free_bot: bot.SenderBot):
+        """Deletes the messages of delete tasks of one channel in one call."""
+        result = await free_bot.DeleteMany(tasks[0].channel, [task.delete.message_id for task in tasks])
+        # deleteMessages skips what is not found, the same as "message to delete not found" for a single delete
+        logging.info("marking %d deletes as done, result: %s", len(tasks), result)
+        for task in tasks:
+            self.MarkSent(task, result)
+
+    async def SendTextGroup(self, tasks: list[tg_sender_api.Task], free_bot: bot.SenderBot):
+        """Sends send_text tasks of one channel as one message, all of them get its message id."""
+        head = tasks[0]
+        bmd = base_message_data.BaseMessageDataBuilder\
+            .create(head.channel, head.thread_id)\
+            .add_text(TEXT_SEPARATOR.join(task.send_text.text for task in tasks))\
+            .from_message_options(head.options)\
+            .build()
+        message = await free_bot.SendText(bmd)
+        logging.info("marking %d coalesced texts as sent", len(tasks))
+        for task in tasks:
+            self.MarkSent(task, message.message_id)
+
+    async def SendPhotoGroup(self, tasks: list[tg_sender_api.Task], free_bot: bot.SenderBot):
+        """Sends send_photo tasks of one channel as a media group, every task gets its own message id."""
+        head = tasks[0]
+        bmd = base_message_data.BaseMessageDataBuilder\
+            .create(head.channel, head.thread_id)\
+            .from_message_options(head.options)\
+            .build()
+        messages = await free_bot.SendMultipleImages(
+            bmd, [task.send_photo.data or task.send_photo.path for task in tasks], [task.send_photo.caption for task in tasks])
+        logging.info("marking %d coalesced photos as sent", len(tasks))
+        for task, message in zip(tasks, messages):
+            self.MarkSent(task, message.message_id)
+
     async def SendPhoto(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
         task_impl = task.send_photo
         bmd = base_message_data.BaseMessageDataBuilder\
@@ -178,7 +675,7 @@ class MessagesProducer:
             .add_text(task_impl.caption)\
             .from_message_options(task.options)\
             .build()
-        message_future = free_bot.SendPhoto(bmd, task_impl.path)
+        message_future = free_bot.SendPhoto(bmd, task_impl.data or task_impl.path, self.GetBroadcastFileIds(task))
         return await self.WrapTGCall(message_future, task)
 
     async def SendPhotos(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
@@ -189,7 +686,8 @@ class MessagesProducer:
             .from_message_options(task.options)\
             .build()
             
-        message_future = free_bot.SendMultipleImages(bmd, task_impl.paths)
+        message_future = free_bot.SendMultipleImages(bmd, list(task_impl.paths) + list(task_impl.data),
+                                                     file_ids = self.GetBroadcastFileIds(task))
         return await self.WrapTGCall(message_future, task)
     
     async def SendFile(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
@@ -199,7 +697,8 @@ class MessagesProducer:
             .add_text(task_impl.caption)\
             .from_message_options(task.options)\
             .build()
-        message_future = free_bot.SendFile(bmd, task_impl.path)
+        message_future = free_bot.SendFile(bmd, task_impl.data or task_impl.path, task_impl.filename or None,
+                                           self.GetBroadcastFileIds(task))
         return await self.WrapTGCall(message_future, task)
     
     async def Forward(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
@@ -208,6 +707,12 @@ class MessagesProducer:
         message_future = free_bot.Forward(channel, task_impl.from_channel, task_impl.message_id, task.thread_id)
         return await self.WrapTGCall(message_future, task)
 
+    async def Copy(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
+        channel = task.channel
+        task_impl = task.copy
+        message_future = free_bot.Copy(channel, task_impl.from_channel, task_impl.message_id, task.thread_id, task_impl.remove_caption)
+        return await self.WrapTGCall(message_future, task)
+
     async def Pin(self, task: tg_sender_api.Task, free_bot: bot.SenderBot):
         channel = task.channel
         task_impl = task.pin
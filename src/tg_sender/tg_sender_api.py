@@ -2,11 +2,18 @@
 # sources: tg_sender.proto
 # plugin: python-betterproto
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List
 
 import betterproto
 
 
+class ChatType(betterproto.Enum):
+    CHAT_TYPE_UNKNOWN = 0
+    CHAT_TYPE_PRIVATE = 1
+    CHAT_TYPE_GROUP = 2
+    CHAT_TYPE_CHANNEL = 3
+
+
 @dataclass
 class MessageOptions(betterproto.Message):
     parse_mode: str = betterproto.string_field(1)
@@ -30,18 +37,22 @@ class SendText(betterproto.Message):
 class SendPhoto(betterproto.Message):
     caption: str = betterproto.string_field(1)
     path: str = betterproto.string_field(2)
+    data: bytes = betterproto.bytes_field(3)
 
 
 @dataclass
 class SendPhotos(betterproto.Message):
     caption: str = betterproto.string_field(1)
     paths: List[str] = betterproto.string_field(2)
+    data: List[bytes] = betterproto.bytes_field(3)
 
 
 @dataclass
 class SendFile(betterproto.Message):
     caption: str = betterproto.string_field(1)
     path: str = betterproto.string_field(2)
+    data: bytes = betterproto.bytes_field(3)
+    filename: str = betterproto.string_field(4)
 
 
 @dataclass
@@ -50,6 +61,13 @@ class Forward(betterproto.Message):
     message_id: int = betterproto.int64_field(2)
 
 
+@dataclass
+class Copy(betterproto.Message):
+    from_channel: str = betterproto.string_field(1)
+    message_id: int = betterproto.int64_field(2)
+    remove_caption: bool = betterproto.bool_field(3)
+
+
 @dataclass
 class Pin(betterproto.Message):
     message_id: int = betterproto.int64_field(1)
@@ -66,6 +84,9 @@ class TaskDetails(betterproto.Message):
     in_process: bool = betterproto.bool_field(1)
     sent: bool = betterproto.bool_field(2)
     result: int = betterproto.int64_field(3)
+    journal_id: int = betterproto.int64_field(4)
+    attempts: int = betterproto.int32_field(5)
+    retry_at: float = betterproto.double_field(6)
 
 
 @dataclass
@@ -85,6 +106,23 @@ class SendMarkup(betterproto.Message):
     buttons: List["Button"] = betterproto.message_field(2)
 
 
+@dataclass
+class Broadcast(betterproto.Message):
+    """
+    the same payload for many channels, rendered once and uploaded once per bot
+    """
+
+    channels: List[str] = betterproto.string_field(1)
+    send_text: "SendText" = betterproto.message_field(2, group="payload")
+    send_photo: "SendPhoto" = betterproto.message_field(3, group="payload")
+    send_photos: "SendPhotos" = betterproto.message_field(4, group="payload")
+    send_file: "SendFile" = betterproto.message_field(5, group="payload")
+    send_markup: "SendMarkup" = betterproto.message_field(6, group="payload")
+    results: Dict[str, int] = betterproto.map_field(
+        7, betterproto.TYPE_STRING, betterproto.TYPE_INT64
+    )
+
+
 @dataclass
 class Task(betterproto.Message):
     options: "MessageOptions" = betterproto.message_field(1)
@@ -102,3 +140,6 @@ class Task(betterproto.Message):
     unpin: "Unpin" = betterproto.message_field(13, group="task")
     delete: "Delete" = betterproto.message_field(14, group="task")
     send_markup: "SendMarkup" = betterproto.message_field(15, group="task")
+    broadcast: "Broadcast" = betterproto.message_field(17, group="task")
+    copy: "Copy" = betterproto.message_field(18, group="task")
+    chat_type: "ChatType" = betterproto.enum_field(16)
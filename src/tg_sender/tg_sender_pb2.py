@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: tg_sender.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'tg_sender.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0ftg_sender.proto\x12\rtg_sender_api\"W\n\x0eMessageOptions\x12\x12\n\nparse_mode\x18\x01 \x01(\t\x12\x1f\n\x17\x65nable_web_page_preview\x18\x03 \x01(\x08\x12\x10\n\x08reply_to\x18\x04 \x01(\x03\"F\n\x0eMessageDetails\x12\x12\n\nin_process\x18\x01 \x01(\x08\x12\x0c\n\x04sent\x18\x02 \x01(\x08\x12\x12\n\nmessage_id\x18\x03 \x01(\x03\"\x18\n\x08SendText\x12\x0c\n\x04text\x18\x01 \x01(\t\"8\n\tSendPhoto\x12\x0f\n\x07\x63\x61ption\x18\x01 \x01(\t\x12\x0c\n\x04path\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\":\n\nSendPhotos\x12\x0f\n\x07\x63\x61ption\x18\x01 \x01(\t\x12\r\n\x05paths\x18\x02 \x03(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x03(\x0c\"I\n\x08SendFile\x12\x0f\n\x07\x63\x61ption\x18\x01 \x01(\t\x12\x0c\n\x04path\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\x12\x10\n\x08\x66ilename\x18\x04 \x01(\t\"3\n\x07\x46orward\x12\x14\n\x0c\x66rom_channel\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\x03\"H\n\x04\x43opy\x12\x14\n\x0c\x66rom_channel\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\x03\x12\x16\n\x0eremove_caption\x18\x03 \x01(\x08\"6\n\x03Pin\x12\x12\n\nmessage_id\x18\x01 \x01(\x03\x12\x1b\n\x13\x65nable_notification\x18\x02 \x01(\x08\"\x1b\n\x05Unpin\x12\x12\n\nmessage_id\x18\x01 \x01(\x03\"w\n\x0bTaskDetails\x12\x12\n\nin_process\x18\x01 \x01(\x08\x12\x0c\n\x04sent\x18\x02 \x01(\x08\x12\x0e\n\x06result\x18\x03 \x01(\x03\x12\x12\n\njournal_id\x18\x04 \x01(\x03\x12\x10\n\x08\x61ttempts\x18\x05 \x01(\x05\x12\x10\n\x08retry_at\x18\x06 \x01(\x01\"\x1c\n\x06\x44\x65lete\x12\x12\n\nmessage_id\x18\x01 \x01(\x03\"-\n\x06\x42utton\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x15\n\rcallback_data\x18\x02 \x01(\t\"B\n\nSendMarkup\x12\x0c\n\x04text\x18\x01 \x01(\t\x12&\n\x07\x62uttons\x18\x02 \x03(\x0b\x32\x15.tg_sender_api.Button\"\x80\x03\n\tBroadcast\x12\x10\n\x08\x63hannels\x18\x01 \x03(\t\x12,\n\tsend_text\x18\x02 \x01(\x0b\x32\x17.tg_sender_api.SendTextH\x00\x12.\n\nsend_photo\x18\x03 \x01(\x0b\x32\x18.tg_sender_api.SendPhotoH\x00\x12\x30\n\x0bsend_photos\x18\x04 \x01(\x0b\x32\x19.tg_sender_api.SendPhotosH\x00\x12,\n\tsend_file\x18\x05 \x01(\x0b\x32\x17.tg_sender_api.SendFileH\x00\x12\x30\n\x0bsend_markup\x18\x06 \x01(\x0b\x32\x19.tg_sender_api.SendMarkupH\x00\x12\x36\n\x07results\x18\x07 \x03(\x0b\x32%.tg_sender_api.Broadcast.ResultsEntry\x1a.\n\x0cResultsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\x42\t\n\x07payload\"\xd4\x05\n\x04Task\x12.\n\x07options\x18\x01 \x01(\x0b\x32\x1d.tg_sender_api.MessageOptions\x12+\n\x07\x64\x65tails\x18\x02 \x01(\x0b\x32\x1a.tg_sender_api.TaskDetails\x12\x0f\n\x07\x63hannel\x18\x03 \x01(\t\x12\x11\n\tthread_id\x18\x04 \x01(\x03\x12\x18\n\x10\x63ustom_int_field\x18\x05 \x01(\x03\x12\x1b\n\x13\x63ustom_string_field\x18\x06 \x01(\t\x12,\n\tsend_text\x18\x07 \x01(\x0b\x32\x17.tg_sender_api.SendTextH\x00\x12.\n\nsend_photo\x18\x08 \x01(\x0b\x32\x18.tg_sender_api.SendPhotoH\x00\x12\x30\n\x0bsend_photos\x18\t \x01(\x0b\x32\x19.tg_sender_api.SendPhotosH\x00\x12,\n\tsend_file\x18\n \x01(\x0b\x32\x17.tg_sender_api.SendFileH\x00\x12)\n\x07\x66orward\x18\x0b \x01(\x0b\x32\x16.tg_sender_api.ForwardH\x00\x12!\n\x03pin\x18\x0c \x01(\x0b\x32\x12.tg_sender_api.PinH\x00\x12%\n\x05unpin\x18\r \x01(\x0b\x32\x14.tg_sender_api.UnpinH\x00\x12\'\n\x06\x64\x65lete\x18\x0e \x01(\x0b\x32\x15.tg_sender_api.DeleteH\x00\x12\x30\n\x0bsend_markup\x18\x0f \x01(\x0b\x32\x19.tg_sender_api.SendMarkupH\x00\x12-\n\tbroadcast\x18\x11 \x01(\x0b\x32\x18.tg_sender_api.BroadcastH\x00\x12#\n\x04\x63opy\x18\x12 \x01(\x0b\x32\x13.tg_sender_api.CopyH\x00\x12*\n\tchat_type\x18\x10 \x01(\x0e\x32\x17.tg_sender_api.ChatTypeB\x06\n\x04task*d\n\x08\x43hatType\x12\x15\n\x11\x43HAT_TYPE_UNKNOWN\x10\x00\x12\x15\n\x11\x43HAT_TYPE_PRIVATE\x10\x01\x12\x13\n\x0f\x43HAT_TYPE_GROUP\x10\x02\x12\x15\n\x11\x43HAT_TYPE_CHANNEL\x10\x03\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'tg_sender_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_BROADCAST_RESULTSENTRY']._loaded_options = None
+  _globals['_BROADCAST_RESULTSENTRY']._serialized_options = b'8\001'
+  _globals['_CHATTYPE']._serialized_start=2006
+  _globals['_CHATTYPE']._serialized_end=2106
+  _globals['_MESSAGEOPTIONS']._serialized_start=34
+  _globals['_MESSAGEOPTIONS']._serialized_end=121
+  _globals['_MESSAGEDETAILS']._serialized_start=123
+  _globals['_MESSAGEDETAILS']._serialized_end=193
+  _globals['_SENDTEXT']._serialized_start=195
+  _globals['_SENDTEXT']._serialized_end=219
+  _globals['_SENDPHOTO']._serialized_start=221
+  _globals['_SENDPHOTO']._serialized_end=277
+  _globals['_SENDPHOTOS']._serialized_start=279
+  _globals['_SENDPHOTOS']._serialized_end=337
+  _globals['_SENDFILE']._serialized_start=339
+  _globals['_SENDFILE']._serialized_end=412
+  _globals['_FORWARD']._serialized_start=414
+  _globals['_FORWARD']._serialized_end=465
+  _globals['_COPY']._serialized_start=467
+  _globals['_COPY']._serialized_end=539
+  _globals['_PIN']._serialized_start=541
+  _globals['_PIN']._serialized_end=595
+  _globals['_UNPIN']._serialized_start=597
+  _globals['_UNPIN']._serialized_end=624
+  _globals['_TASKDETAILS']._serialized_start=626
+  _globals['_TASKDETAILS']._serialized_end=745
+  _globals['_DELETE']._serialized_start=747
+  _globals['_DELETE']._serialized_end=775
+  _globals['_BUTTON']._serialized_start=777
+  _globals['_BUTTON']._serialized_end=822
+  _globals['_SENDMARKUP']._serialized_start=824
+  _globals['_SENDMARKUP']._serialized_end=890
+  _globals['_BROADCAST']._serialized_start=893
+  _globals['_BROADCAST']._serialized_end=1277
+  _globals['_BROADCAST_RESULTSENTRY']._serialized_start=1220
+  _globals['_BROADCAST_RESULTSENTRY']._serialized_end=1266
+  _globals['_TASK']._serialized_start=1280
+  _globals['_TASK']._serialized_end=2004
+# @@protoc_insertion_point(module_scope)